@@ -0,0 +1,85 @@
+import argparse
+import json
+import time
+from codec import JSON_CODECS, load_json_codec
+from frame_protocol import GEOMETRY_FIELDS
+
+# Кадры экрана идут двоичными сообщениями frame_protocol и JSON не затрагивают;
+# через кодек проходят только команды, подтверждения, геометрия и статусы
+FRAME_GEOMETRY = {
+    "original_width": 1920, "original_height": 1080,
+    "scaled_width": 1920, "scaled_height": 1080,
+    "offset_x": 0, "offset_y": 0, "scale_ratio": 1.0,
+    "origin_x": 0, "origin_y": 0,
+}
+
+def make_hops():
+    """Операции сериализации на пути JSON-сообщений: (название, функция от кодека, размер)"""
+    command = {"type": "control_command", "command": "mouse_move", "data": dict(FRAME_GEOMETRY, x=100, y=200)}
+    ack = {"type": "frame_ack", "frame_id": 123456}
+    geometry = {"type": "screen_geometry", "epoch": 3, **{field: FRAME_GEOMETRY[field] for field in GEOMETRY_FIELDS}}
+    status = {
+        "type": "status_update", "status": "info", "message": "Поток: jpeg q85, 100% разрешения, до 10 FPS",
+        "timestamp": time.time(),
+        "stream": {"adaptive": True, "encoder": "jpeg q85", "scale": 1.0, "fps": 10.0,
+                   "level": 0, "latency_ms": 12, "kbps": 2400, "ack_latency_ms": 40},
+    }
+    raw_command = json.dumps(command).encode('utf-8')
+    raw_ack = json.dumps(ack).encode('utf-8')
+    raw_geometry = json.dumps(geometry).encode('utf-8')
+    raw_status = json.dumps(status, ensure_ascii=False).encode('utf-8')
+
+    return [
+        ("управляющий: dumps команды", lambda loads, dumpb: dumpb(command), len(raw_command)),
+        ("сервер: loads+dumps команды", lambda loads, dumpb: dumpb(loads(raw_command)), len(raw_command)),
+        ("сервер: loads+dumps frame_ack", lambda loads, dumpb: dumpb(loads(raw_ack)), len(raw_ack)),
+        ("сервер: loads+dumps геометрии", lambda loads, dumpb: dumpb(loads(raw_geometry)), len(raw_geometry)),
+        ("управляющий: loads статуса", lambda loads, dumpb: loads(raw_status), len(raw_status)),
+    ]
+
+def measure(function, loads, dumpb, min_time):
+    """Операций в секунду за не меньше чем min_time секунд"""
+    count = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for _ in range(10):
+            function(loads, dumpb)
+        count += 10
+        elapsed = time.perf_counter() - started
+    return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность JSON-кодеков на шагах ретрансляции служебных сообщений")
+    parser.add_argument("--min-time", type=float, default=0.5, help="длительность замера одного шага, с")
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    args = parser.parse_args()
+
+    backends = []
+    for name in JSON_CODECS:
+        try:
+            backends.append(load_json_codec(name))
+        except ImportError:
+            pass
+
+    results = []
+    for hop, function, size in make_hops():
+        row = {"hop": hop, "bytes": size, "ops_per_second": {}}
+        for name, loads, dumpb in backends:
+            row["ops_per_second"][name] = round(measure(function, loads, dumpb, args.min_time), 1)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    names = [name for name, _, _ in backends]
+    print(f"{'шаг':<34}" + "".join(f"{name + ', оп/с':>16}" for name in names) + f"{'ускорение':>11}")
+    for row in results:
+        rates = row["ops_per_second"]
+        best = max(rates.values())
+        speedup = best / rates["json"]
+        print(f"{row['hop']:<34}" + "".join(f"{rates[name]:>16.1f}" for name in names) + f"{speedup:>10.1f}x")
+
+if __name__ == "__main__":
+    main()
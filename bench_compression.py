@@ -0,0 +1,107 @@
+import argparse
+import io
+import json
+import os
+import random
+import time
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+from frame_protocol import encode_keyframe, session_tag
+from ws_compression import SelectivePerMessageDeflate
+
+def make_frame_payload(width, height):
+    """JPEG-кадр, похожий на рабочий стол; без Pillow - случайные байты того же размера"""
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError:
+        return os.urandom(width * height // 10)
+
+    rng = random.Random(1)
+    image = Image.new('RGB', (width, height), (32, 64, 112))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle((x, y, x + rng.randrange(50, 600), y + rng.randrange(20, 400)), fill=color)
+    for line in range(0, height, 18):
+        draw.text((20, line), "".join(rng.choice("abcdefghij klmnop") for _ in range(120)), fill=(255, 255, 255))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True)
+    return buffer.getvalue()
+
+def make_messages(frames, commands_per_frame, width, height):
+    """Набор исходящих сообщений ретранслятора: кадры экрана, команды мыши и статусы"""
+    frame = encode_keyframe(session_tag("bench"), 1, time.time(), 1, make_frame_payload(width, height))
+
+    messages = []
+    for index in range(frames):
+        messages.append((Opcode.BINARY, frame))
+        for step in range(commands_per_frame):
+            messages.append((Opcode.TEXT, json.dumps({
+                "type": "execute_command",
+                "command": "mouse_move",
+                "data": {"x": 100 + step, "y": 200 + index, "scale_ratio": 1.0,
+                         "offset_x": 0, "offset_y": 0, "scaled_width": width, "scaled_height": height}
+            }).encode('utf-8')))
+        messages.append((Opcode.TEXT, json.dumps({
+            "type": "controlled_status",
+            "info": f"Статистика: {index} кадров, 10.0 FPS"
+        }, ensure_ascii=False).encode('utf-8')))
+    return messages
+
+def make_extension(mode):
+    if mode == "off":
+        return None
+    extension_class = SelectivePerMessageDeflate if mode == "selective" else PerMessageDeflate
+    return extension_class(False, False, 12, 12, {"memLevel": 5})
+
+def run_mode(mode, messages):
+    extension = make_extension(mode)
+    bytes_in = 0
+    bytes_out = 0
+    frame_bytes_out = 0
+    start_cpu = time.process_time()
+    for opcode, message in messages:
+        frame = Frame(opcode, message)
+        if extension:
+            frame = extension.encode(frame)
+        bytes_in += len(message)
+        bytes_out += len(frame.data)
+        if opcode is Opcode.BINARY:
+            frame_bytes_out += len(frame.data)
+    cpu = time.process_time() - start_cpu
+    return {
+        "mode": mode,
+        "messages": len(messages),
+        "cpu_seconds": round(cpu, 4),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "frame_bytes_out": frame_bytes_out,
+        "control_bytes_out": bytes_out - frame_bytes_out,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU и объем трафика при разных режимах сжатия WebSocket")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--commands-per-frame", type=int, default=3)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    args = parser.parse_args()
+
+    messages = make_messages(args.frames, args.commands_per_frame, args.width, args.height)
+    results = [run_mode(mode, messages) for mode in ("deflate", "selective", "off")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    deflate_cpu = results[0]["cpu_seconds"] or 1e-9
+    print(f"{'режим':<10} {'CPU, с':>8} {'экономия CPU':>13} {'кадры, байт':>13} {'команды, байт':>14}")
+    for result in results:
+        saved = 100 * (1 - result["cpu_seconds"] / deflate_cpu)
+        print(f"{result['mode']:<10} {result['cpu_seconds']:>8.3f} {saved:>12.1f}% "
+              f"{result['frame_bytes_out']:>13} {result['control_bytes_out']:>14}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import base64
+import io
+import json
+import time
+from capture_sources import SyntheticSource, make_desktop
+from frame_delta import TileDiffer
+
+def encode_jpeg(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def run_scenario(name, base, frames):
+    differ = TileDiffer()
+    full_bytes = 0
+    delta_bytes = 0
+    keyframes = 0
+    full_seconds = 0.0
+    delta_seconds = 0.0
+    source = SyntheticSource(name, base=base)
+    for _ in range(frames):
+        frame = source.grab()
+        started = time.perf_counter()
+        full_bytes += len(encode_jpeg(frame))
+        full_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        rects = differ.diff(frame)
+        if rects is None:
+            keyframes += 1
+            delta_bytes += len(encode_jpeg(frame))
+        else:
+            for x, y, width, height in rects:
+                # Плитка кодируется так же, как в RemoteControlledClient.encode_frame_message
+                delta_bytes += len(encode_jpeg(frame.crop((x, y, x + width, y + height)))) + 24
+        delta_seconds += time.perf_counter() - started
+    return {
+        "scenario": name,
+        "frames": frames,
+        "keyframes": keyframes,
+        "full_bytes_per_frame": full_bytes // frames,
+        "delta_bytes_per_frame": delta_bytes // frames,
+        "reduction": round(full_bytes / max(delta_bytes, 1), 1),
+        "full_ms_per_frame": round(1000 * full_seconds / frames, 1),
+        "delta_ms_per_frame": round(1000 * delta_seconds / frames, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Трафик и CPU полных кадров и дельт по плиткам")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    args = parser.parse_args()
+
+    base = make_desktop(args.width, args.height)
+    results = [run_scenario(name, base, args.frames) for name in ("cursor", "typing", "scroll", "video")]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'сценарий':<10} {'полный, байт':>13} {'дельта, байт':>13} {'выигрыш':>8} {'полный, мс':>11} {'дельта, мс':>11}")
+    for result in results:
+        print(f"{result['scenario']:<10} {result['full_bytes_per_frame']:>13} {result['delta_bytes_per_frame']:>13} "
+              f"{result['reduction']:>7.1f}x {result['full_ms_per_frame']:>11} {result['delta_ms_per_frame']:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import io
+import json
+import time
+from PIL import Image, ImageChops, ImageStat
+from capture_sources import make_desktop
+from frame_encoders import ENCODER_PRESETS, create_encoder
+
+def make_screens(width, height, paths):
+    """Представительные кадры: рабочий стол с текстом, он же с видео и скриншоты из файлов"""
+    desktop = make_desktop(width, height)
+    video = desktop.copy()
+    video.paste(Image.effect_noise((width // 2, height // 2), 40).convert('RGB'), (width // 4, height // 4))
+    screens = [("text", desktop), ("video", video)]
+    for path in paths:
+        screens.append((path, Image.open(path).convert('RGB')))
+    return screens
+
+def mean_error(original, decoded):
+    """Средняя абсолютная ошибка по каналам: 0 - без потерь"""
+    return round(sum(ImageStat.Stat(ImageChops.difference(original, decoded.convert('RGB'))).mean) / 3, 2)
+
+def run_encoder(preset, screens, repeat):
+    encoder = create_encoder(preset)
+    results = []
+    for name, image in screens:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            data = encoder.encode(image)
+        encode_ms = 1000 * (time.perf_counter() - started) / repeat
+
+        started = time.perf_counter()
+        decoded = Image.open(io.BytesIO(data))
+        decoded.load()
+        decode_ms = 1000 * (time.perf_counter() - started)
+        results.append({
+            "encoder": preset,
+            "settings": encoder.describe(),
+            "screen": name,
+            "bytes": len(data),
+            "encode_ms": round(encode_ms, 1),
+            "decode_ms": round(decode_ms, 1),
+            "error": mean_error(image, decoded),
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Время кодирования и размер кадра для кодировщиков экрана")
+    parser.add_argument("--encoders", nargs="*", default=list(ENCODER_PRESETS), help="предустановки FRAME_ENCODER")
+    parser.add_argument("--images", nargs="*", default=[], help="скриншоты для замера вместе с синтетическими")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    args = parser.parse_args()
+
+    screens = make_screens(args.width, args.height, args.images)
+    results = [result for preset in args.encoders for result in run_encoder(preset, screens, args.repeat)]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'кодировщик':<15} {'экран':<8} {'байт':>9} {'кодир., мс':>11} {'декод., мс':>11} {'ошибка':>7}")
+    for result in results:
+        print(f"{result['encoder']:<15} {result['screen']:<8} {result['bytes']:>9} {result['encode_ms']:>11} "
+              f"{result['decode_ms']:>11} {result['error']:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+import websockets
+from frame_protocol import decode_header, encode_keyframe, session_tag
+from ws_compression import client_compression_options
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server_railway.py")
+
+class LoadStats:
+    """Результаты нагрузочных клиентов одного процесса"""
+    def __init__(self):
+        self.measuring = False
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.bytes_received = 0
+        self.inputs_sent = 0
+        self.inputs_received = 0
+        self.frame_latencies = []
+        self.input_latencies = []
+        self.errors = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+async def connect(uri, kind, session_id):
+    websocket = await websockets.connect(
+        uri, max_size=None, ping_interval=None, **client_compression_options()
+    )
+    await websocket.send(json.dumps({
+        "type": kind,
+        "client_id": f"bench_{kind}_{session_id}",
+        "session_id": session_id
+    }))
+    reply = json.loads(await websocket.recv())
+    if reply.get("type") != "connection_established":
+        raise RuntimeError(f"{kind} {session_id}: {reply}")
+    return websocket
+
+async def run_controlled(websocket, session_id, args, stats, deadline):
+    """Синтетический управляемый клиент: поток кадров и прием команд"""
+    payload = os.urandom(args.frame_size)
+    tag = session_tag(session_id)
+    interval = 1.0 / args.fps
+
+    async def receive_commands():
+        async for message in websocket:
+            data = json.loads(message)
+            if data.get("type") == "execute_command" and stats.measuring:
+                stats.inputs_received += 1
+                stats.input_latencies.append(time.time() - data["data"]["sent_at"])
+
+    receiver = asyncio.create_task(receive_commands())
+    try:
+        next_frame = time.monotonic() + random.random() * interval
+        frame_id = 0
+        while time.monotonic() < deadline:
+            await asyncio.sleep(max(next_frame - time.monotonic(), 0))
+            next_frame += interval
+            frame_id += 1
+            await websocket.send(encode_keyframe(tag, frame_id, time.time(), 1, payload))
+            if stats.measuring:
+                stats.frames_sent += 1
+    finally:
+        receiver.cancel()
+
+async def run_controller(websocket, args, stats, deadline):
+    """Синтетический управляющий клиент: поток движений мыши и прием кадров"""
+    async def receive_frames():
+        async for message in websocket:
+            if not isinstance(message, bytes):
+                continue
+            sent_at = decode_header(message).timestamp
+            if stats.measuring:
+                stats.frames_received += 1
+                stats.bytes_received += len(message)
+                stats.frame_latencies.append(time.time() - sent_at)
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        interval = 1.0 / args.input_rate if args.input_rate else None
+        position = 0
+        while time.monotonic() < deadline:
+            if interval is None:
+                await asyncio.sleep(min(deadline - time.monotonic(), 1.0))
+                continue
+            await asyncio.sleep(interval)
+            position += 1
+            await websocket.send(json.dumps({
+                "type": "control_command",
+                "command": "mouse_move",
+                "data": {"x": position % 1920, "y": position % 1080, "sent_at": time.time()}
+            }))
+            if stats.measuring:
+                stats.inputs_sent += 1
+    finally:
+        receiver.cancel()
+
+async def run_sessions(uri, session_ids, args):
+    stats = LoadStats()
+    pairs = []
+    for session_id in session_ids:
+        controller = await connect(uri, "controller", session_id)
+        controlled = await connect(uri, "controlled", session_id)
+        pairs.append((controller, controlled))
+
+    deadline = time.monotonic() + args.warmup + args.duration
+    tasks = []
+    for session_id, (controller, controlled) in zip(session_ids, pairs):
+        tasks.append(asyncio.create_task(run_controller(controller, args, stats, deadline)))
+        tasks.append(asyncio.create_task(run_controlled(controlled, session_id, args, stats, deadline)))
+
+    await asyncio.sleep(args.warmup)
+    stats.measuring = True
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    stats.measuring = False
+    stats.errors = sum(1 for result in results if isinstance(result, Exception))
+
+    for controller, controlled in pairs:
+        await controller.close()
+        await controlled.close()
+    return stats.as_dict()
+
+def run_client_process(uri, session_ids, args):
+    return asyncio.run(run_sessions(uri, session_ids, args))
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(fraction):
+        return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(ordered[-1] * 1000, 2)}
+
+def process_tree_cpu_seconds(pid):
+    """Процессорное время процесса и его дочерних процессов (воркеров)"""
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        total = 0.0
+        for item in [process] + process.children(recursive=True):
+            times = item.cpu_times()
+            total += times.user + times.system
+        return total
+    except ImportError:
+        pass
+
+    ticks = os.sysconf('SC_CLK_TCK')
+    total = 0.0
+    pids = {pid}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat_file:
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(entry) in pids or int(fields[1]) in pids:
+            total += (int(fields[11]) + int(fields[12])) / ticks
+    return total
+
+def start_server(port, workers):
+    # Все сессии бенчмарка идут с одного адреса: лимит сессий на IP ему мешает
+    env = dict(os.environ, PORT=str(port), WORKERS=str(workers), MAX_SESSIONS_PER_IP="0")
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1).read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Сервер не запустился")
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест ретранслятора server_railway.py")
+    parser.add_argument("--sessions", type=int, default=10, help="число пар управляющий/управляемый")
+    parser.add_argument("--frame-size", type=int, default=200_000, help="размер изображения кадра в байтах")
+    parser.add_argument("--fps", type=float, default=10.0, help="частота кадров каждого управляемого")
+    parser.add_argument("--input-rate", type=float, default=30.0, help="движений мыши в секунду на управляющего")
+    parser.add_argument("--duration", type=float, default=10.0, help="длительность измерения, с")
+    parser.add_argument("--warmup", type=float, default=2.0, help="прогрев перед измерением, с")
+    parser.add_argument("--client-processes", type=int, default=1, help="процессов нагрузочных клиентов")
+    parser.add_argument("--url", help="адрес уже запущенного сервера (иначе запускается локальный)")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--workers", type=int, default=1, help="WORKERS для локального сервера")
+    parser.add_argument("--json", action="store_true", help="машиночитаемый вывод")
+    parser.add_argument("--output", help="сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        uri = args.url
+    else:
+        server = start_server(args.port, args.workers)
+        uri = f"ws://127.0.0.1:{args.port}"
+
+    try:
+        session_ids = [f"bench-{index}" for index in range(args.sessions)]
+        groups = [session_ids[index::args.client_processes] for index in range(args.client_processes)]
+        groups = [group for group in groups if group]
+
+        cpu_start = process_tree_cpu_seconds(server.pid) if server else None
+        started = time.monotonic()
+        if len(groups) == 1:
+            parts = [run_client_process(uri, groups[0], args)]
+        else:
+            with multiprocessing.Pool(len(groups)) as pool:
+                parts = pool.starmap(run_client_process, [(uri, group, args) for group in groups])
+        elapsed = time.monotonic() - started
+        cpu_used = process_tree_cpu_seconds(server.pid) - cpu_start if server else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    totals = LoadStats().as_dict()
+    for part in parts:
+        for key, value in part.items():
+            if key != "measuring":
+                totals[key] = totals[key] + value
+
+    duration = args.duration
+    result = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "output")},
+        "frames_sent": totals["frames_sent"],
+        "frames_delivered": totals["frames_received"],
+        "frames_per_second": round(totals["frames_received"] / duration, 1),
+        "bytes_per_second": round(totals["bytes_received"] / duration),
+        "frame_delivery_ratio": round(totals["frames_received"] / max(totals["frames_sent"], 1), 3),
+        "frame_latency_ms": percentiles(totals["frame_latencies"]),
+        "input_latency_ms": percentiles(totals["input_latencies"]),
+        "inputs_sent": totals["inputs_sent"],
+        "inputs_delivered": totals["inputs_received"],
+        "client_errors": totals["errors"],
+        # Время процессора сервера включает прогрев и подключение клиентов
+        "server_cpu_seconds": round(cpu_used, 2) if cpu_used is not None else None,
+        "server_cpu_percent": round(100 * cpu_used / elapsed, 1) if cpu_used is not None else None,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(result, output_file, indent=2)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"📊 Сессий: {args.sessions}, кадр {args.frame_size} байт @ {args.fps} FPS, ввод {args.input_rate}/с")
+    print(f"🖼️ Кадров доставлено: {result['frames_delivered']}/{result['frames_sent']} "
+          f"({result['frames_per_second']} кадр/с, {result['bytes_per_second'] / 1e6:.1f} МБ/с)")
+    for name, key in (("Задержка кадров", "frame_latency_ms"), ("Задержка ввода", "input_latency_ms")):
+        values = result[key]
+        if values:
+            print(f"⏱️ {name}, мс: p50={values['p50']} p95={values['p95']} p99={values['p99']} max={values['max']}")
+    if result["server_cpu_percent"] is not None:
+        print(f"🔥 CPU сервера: {result['server_cpu_percent']}% ({result['server_cpu_seconds']} с)")
+    if result["client_errors"]:
+        print(f"⚠️ Ошибок клиентов: {result['client_errors']}")
+
+if __name__ == "__main__":
+    main()
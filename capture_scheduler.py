@@ -0,0 +1,72 @@
+import asyncio
+import os
+import time
+
+# Частота захвата экрана в зависимости от активности.
+# CAPTURE_MAX_FPS - потолок при активности, CAPTURE_IDLE_FPS - частота в простое,
+# CAPTURE_IDLE_AFTER - через сколько секунд без изменений экрана и ввода начинается снижение.
+
+DEFAULT_MAX_FPS = 10.0
+DEFAULT_IDLE_FPS = 1.0
+DEFAULT_IDLE_AFTER = 3.0
+# Во сколько раз растет интервал захвата за кадр без изменений после начала простоя
+IDLE_BACKOFF = 1.5
+
+class CaptureScheduler:
+    """Планировщик захвата: потолок FPS при активности, плавное снижение в простое
+
+    Активностью считаются изменившийся кадр и команды ввода. Команда ввода
+    прерывает ожидание, поэтому первый кадр после действия пользователя
+    захватывается сразу, а не через интервал простоя.
+    """
+    def __init__(self, max_fps=None, idle_fps=None, idle_after=None):
+        self.max_fps = max_fps or float(os.environ.get('CAPTURE_MAX_FPS', DEFAULT_MAX_FPS))
+        # Частота простоя из настроек; потолок FPS может меняться, поэтому меньшая из них берется при расчете
+        self.idle_fps = idle_fps or float(os.environ.get('CAPTURE_IDLE_FPS', DEFAULT_IDLE_FPS))
+        self.idle_after = idle_after if idle_after is not None else float(
+            os.environ.get('CAPTURE_IDLE_AFTER', DEFAULT_IDLE_AFTER)
+        )
+        self.interval = 1.0 / self.max_fps
+        self.last_activity = time.monotonic()
+        self.last_capture = 0.0
+        self.wakeup = asyncio.Event()
+
+    def fps(self):
+        return 1.0 / self.interval
+
+    def is_idle(self):
+        return self.interval > 1.0 / self.max_fps
+
+    def set_max_fps(self, max_fps):
+        """Новый потолок FPS (адаптация потока); в простое текущий интервал сохраняется, если он длиннее"""
+        idle = self.is_idle()
+        self.max_fps = max_fps
+        self.interval = max(self.interval, 1.0 / max_fps) if idle else 1.0 / max_fps
+
+    def mark_activity(self, wake=False):
+        """Активность: возврат к потолку FPS; wake - захватить следующий кадр без ожидания"""
+        self.last_activity = time.monotonic()
+        self.interval = 1.0 / self.max_fps
+        if wake:
+            self.wakeup.set()
+
+    def frame_done(self, changed):
+        """Учет результата захвата: изменился ли экран"""
+        if changed:
+            self.mark_activity()
+        elif time.monotonic() - self.last_activity >= self.idle_after:
+            self.interval = min(self.interval * IDLE_BACKOFF, 1.0 / min(self.idle_fps, self.max_fps))
+
+    async def wait_next(self):
+        """Ожидание момента следующего захвата"""
+        while True:
+            delay = self.last_capture + self.interval - time.monotonic()
+            if delay <= 0:
+                break
+            self.wakeup.clear()
+            try:
+                # После пробуждения интервал уже сброшен к потолку FPS, ждем остаток по нему
+                await asyncio.wait_for(self.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                break
+        self.last_capture = time.monotonic()
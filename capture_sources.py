@@ -0,0 +1,377 @@
+import ctypes
+import ctypes.util
+import glob
+import math
+import os
+import random
+import sys
+import time
+from PIL import Image, ImageDraw
+from frame_protocol import CURSOR_SHAPES
+from monitors import enumerate_monitors, monitor_entry
+
+# Источники кадров экрана для управляемого клиента.
+# CAPTURE_SOURCE=auto|xshm|imagegrab|synthetic; auto - разделяемая память X11, если доступна, иначе ImageGrab.
+# Синтетический источник (без дисплея, для замеров и CI): CAPTURE_SYNTHETIC - сценарий из
+# SYNTHETIC_SCENARIOS, CAPTURE_SYNTHETIC_SIZE=1920x1080, CAPTURE_REPLAY - шаблон файлов
+# с кадрами, которые проигрываются по кругу вместо сценария.
+
+DEFAULT_SYNTHETIC_SIZE = "1920x1080"
+
+class CaptureSource:
+    """Источник кадров: grab(bbox) возвращает RGB-изображение всего экрана или области"""
+    name = None
+
+    def grab(self, bbox=None):
+        raise NotImplementedError
+
+    def screen_size(self):
+        raise NotImplementedError
+
+    def monitors(self):
+        return enumerate_monitors(self.screen_size())
+
+    def cursor(self):
+        """Указатель (x, y, форма, видимость), если источник знает его сам; None - читать системный"""
+        return None
+
+    def close(self):
+        pass
+
+class ImageGrabSource(CaptureSource):
+    """PIL.ImageGrab: работает везде, где есть дисплей"""
+    name = "imagegrab"
+
+    def __init__(self):
+        from PIL import ImageGrab
+        self.image_grab = ImageGrab
+        self.size = None
+
+    def grab(self, bbox=None):
+        if bbox is None:
+            # В Windows без all_screens захватывается только основной монитор, с ним - весь
+            # рабочий стол от его левого верхнего угла (он может быть левее и выше основного).
+            # Размер экрана обновляется при каждом полном захвате: смена разрешения видна сразу
+            image = self.image_grab.grab(all_screens=sys.platform == 'win32')
+            self.size = image.size
+            return image
+        # В Windows без all_screens область за пределами основного монитора захватывается черной
+        return self.image_grab.grab(bbox=bbox, all_screens=sys.platform == 'win32')
+
+    def screen_size(self):
+        if self.size is None:
+            self.size = self.grab().size
+        return self.size
+
+class XImage(ctypes.Structure):
+    # Начало структуры XImage из Xlib.h; остальные поля не нужны
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+class XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte),
+    ]
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(XErrorEvent))
+
+class XShmSource(CaptureSource):
+    """Захват X11 через разделяемую память (MIT-SHM)
+
+    Сервер X копирует пиксели прямо в сегмент разделяемой памяти, без передачи
+    через сокет, как у XGetImage в ImageGrab. Сегмент создается под размер
+    области и переиспользуется, пока размер не изменится. Все вызовы Xlib
+    идут из одного потока захвата.
+
+    Размер экрана перечитывается при каждом захвате всего экрана: после смены
+    разрешения запрос старого размера вызвал бы ошибку X. Ошибки X (например,
+    область за пределами экрана) перехватываются своим обработчиком и
+    превращаются в исключение вместо завершения процесса обработчиком Xlib.
+    """
+    name = "xshm"
+
+    ZPixmap = 2
+    IPC_PRIVATE = 0
+    IPC_CREAT = 0o1000
+    IPC_RMID = 0
+    ALL_PLANES = 0xFFFFFFFF
+
+    def __init__(self):
+        xlib_path = ctypes.util.find_library('X11')
+        xext_path = ctypes.util.find_library('Xext')
+        if not os.environ.get('DISPLAY') or not xlib_path or not xext_path:
+            raise RuntimeError("X11 с расширением MIT-SHM недоступен")
+        self.xlib = xlib = ctypes.CDLL(xlib_path)
+        self.xext = xext = ctypes.CDLL(xext_path)
+        self.libc = libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        for function in ("XDefaultScreen",):
+            getattr(xlib, function).argtypes = [ctypes.c_void_p]
+        for function in ("XRootWindow", "XDefaultVisual", "XDefaultDepth", "XDisplayWidth", "XDisplayHeight"):
+            getattr(xlib, function).argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XRootWindow.restype = ctypes.c_ulong
+        xlib.XDefaultVisual.restype = ctypes.c_void_p
+        xlib.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XGetGeometry.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+            ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+            ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint),
+            ctypes.POINTER(ctypes.c_uint), ctypes.POINTER(ctypes.c_uint)
+        ]
+        xlib.XSetErrorHandler.restype = ctypes.c_void_p
+        xlib.XSetErrorHandler.argtypes = [XErrorHandler]
+        xlib.XFree.argtypes = [ctypes.c_void_p]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+        xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p,
+            ctypes.POINTER(XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint
+        ]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(XImage), ctypes.c_int, ctypes.c_int, ctypes.c_ulong
+        ]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        # Обработчик ошибок X общий для процесса; ссылка на него должна жить, пока жив источник
+        self.x_error = None
+        self.error_handler = XErrorHandler(self.on_x_error)
+        xlib.XSetErrorHandler(self.error_handler)
+        self.display = xlib.XOpenDisplay(None)
+        if not self.display:
+            raise RuntimeError("Не удалось открыть дисплей X11")
+        if not xext.XShmQueryExtension(self.display):
+            xlib.XCloseDisplay(self.display)
+            raise RuntimeError("Сервер X11 не поддерживает MIT-SHM")
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XRootWindow(self.display, screen)
+        self.visual = xlib.XDefaultVisual(self.display, screen)
+        self.depth = xlib.XDefaultDepth(self.display, screen)
+        self.size = (xlib.XDisplayWidth(self.display, screen), xlib.XDisplayHeight(self.display, screen))
+        self.image = None
+        self.image_size = None
+        self.segment = XShmSegmentInfo()
+        # Проверка формата пикселей на пробном сегменте: поддерживается только 32 бита BGRX
+        self.prepare((1, 1))
+        if self.image.contents.bits_per_pixel != 32:
+            self.close()
+            raise RuntimeError("Поддерживается только 32-битный формат пикселей X11")
+
+    def on_x_error(self, display, event):
+        self.x_error = event.contents.error_code
+        return 0
+
+    def root_size(self):
+        """Текущий размер корневого окна (запрос к X-серверу, а не кэш Xlib)"""
+        root = ctypes.c_ulong()
+        x, y = ctypes.c_int(), ctypes.c_int()
+        width, height, border, depth = ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint(), ctypes.c_uint()
+        if self.xlib.XGetGeometry(self.display, self.root, ctypes.byref(root), ctypes.byref(x), ctypes.byref(y),
+                                  ctypes.byref(width), ctypes.byref(height), ctypes.byref(border), ctypes.byref(depth)):
+            self.size = (width.value, height.value)
+        return self.size
+
+    def prepare(self, size):
+        """Сегмент разделяемой памяти и XImage под размер области"""
+        self.release_image()
+        width, height = size
+        image = self.xext.XShmCreateImage(
+            self.display, self.visual, self.depth, self.ZPixmap, None, ctypes.byref(self.segment), width, height
+        )
+        if not image:
+            raise RuntimeError("XShmCreateImage не удался")
+        self.image = image
+        segment_size = image.contents.bytes_per_line * height
+        shmid = self.libc.shmget(self.IPC_PRIVATE, segment_size, self.IPC_CREAT | 0o600)
+        if shmid < 0:
+            raise OSError(ctypes.get_errno(), "shmget не удался")
+        address = self.libc.shmat(shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            self.libc.shmctl(shmid, self.IPC_RMID, None)
+            raise OSError(ctypes.get_errno(), "shmat не удался")
+        self.segment.shmid = shmid
+        self.segment.shmaddr = address
+        self.segment.readOnly = 0
+        image.contents.data = address
+        self.xext.XShmAttach(self.display, ctypes.byref(self.segment))
+        self.xlib.XSync(self.display, 0)
+        # Сегмент удалится сам после отключения от него и X-сервера, и этого процесса
+        self.libc.shmctl(shmid, self.IPC_RMID, None)
+        self.buffer = (ctypes.c_char * segment_size).from_address(address)
+        self.image_size = size
+
+    def release_image(self):
+        if self.image is None:
+            return
+        self.xext.XShmDetach(self.display, ctypes.byref(self.segment))
+        self.xlib.XSync(self.display, 0)
+        self.libc.shmdt(self.segment.shmaddr)
+        # Данные изображения - сегмент разделяемой памяти, освобождается только сама структура
+        self.xlib.XFree(self.image)
+        self.image = None
+        self.buffer = None
+
+    def grab(self, bbox=None):
+        left, top, right, bottom = bbox or (0, 0) + self.root_size()
+        size = (right - left, bottom - top)
+        if size != self.image_size:
+            self.prepare(size)
+        self.x_error = None
+        if not self.xext.XShmGetImage(self.display, self.root, self.image, left, top, self.ALL_PLANES) \
+                or self.x_error is not None:
+            raise RuntimeError(f"XShmGetImage не удался (ошибка X {self.x_error}), область {left},{top} {size}")
+        # Декодирование BGRX копирует пиксели: сегмент перезапишется следующим захватом,
+        # пока этот кадр еще кодируется в другом потоке
+        return Image.frombuffer('RGB', size, self.buffer, 'raw', 'BGRX', self.image.contents.bytes_per_line, 1)
+
+    def screen_size(self):
+        return self.size
+
+    def close(self):
+        if self.display:
+            self.release_image()
+            self.xlib.XCloseDisplay(self.display)
+            self.display = None
+
+def make_desktop(width, height, seed=1):
+    """Синтетический рабочий стол: фон, окна и строки текста"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (32, 64, 112))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(width - 400), rng.randrange(height - 300)
+        draw.rectangle((x, y, x + rng.randrange(300, 900), y + rng.randrange(200, 600)), fill=(236, 236, 236))
+        for line in range(y + 10, y + 190, 16):
+            draw.text((x + 10, line), "".join(rng.choice("abcdefghij klmnop") for _ in range(40)), fill=(20, 20, 20))
+    return image
+
+# Сценарии синтетического источника: static - неподвижный экран, cursor - мигающий курсор,
+# typing - набор текста, scroll - прокрутка окна, video - область с шумом, как у видео
+SYNTHETIC_SCENARIOS = ("static", "cursor", "typing", "scroll", "video")
+
+class SyntheticSource(CaptureSource):
+    """Детерминированный источник без дисплея: сценарий активности или повтор кадров из файлов
+
+    Кадр N зависит только от сценария, размера, seed и N, поэтому прогоны
+    кодирования и отправки воспроизводимы.
+    """
+    name = "synthetic"
+
+    def __init__(self, scenario=None, size=None, seed=1, replay=None, base=None):
+        self.scenario = scenario or os.environ.get('CAPTURE_SYNTHETIC', 'typing')
+        if self.scenario not in SYNTHETIC_SCENARIOS:
+            raise ValueError(f"Неизвестный сценарий синтетического захвата: {self.scenario}")
+        replay = replay if replay is not None else os.environ.get('CAPTURE_REPLAY')
+        self.replay = [Image.open(path).convert('RGB') for path in sorted(glob.glob(replay))] if replay else []
+        if replay and not self.replay:
+            raise ValueError(f"Нет кадров для повтора: {replay}")
+        if base is not None:
+            self.base = base
+        elif self.replay:
+            self.base = self.replay[0]
+        else:
+            width, height = (int(part) for part in (
+                size or os.environ.get('CAPTURE_SYNTHETIC_SIZE', DEFAULT_SYNTHETIC_SIZE)
+            ).lower().split('x'))
+            self.base = make_desktop(width, height, seed)
+        rng = random.Random(seed + 1)
+        self.typed_text = "".join(rng.choice("abcdefghij ") for _ in range(4096))
+        self.noise_seed = seed
+        self.index = 0
+
+    def frame(self, index):
+        """Кадр сценария с номером index"""
+        if self.replay:
+            return self.replay[index % len(self.replay)].copy()
+        frame = self.base.copy()
+        width, height = frame.size
+        draw = ImageDraw.Draw(frame)
+        if self.scenario == "cursor":
+            if index % 5 < 3:
+                draw.rectangle((600, 400, 602, 418), fill=(0, 0, 0))
+        elif self.scenario == "typing":
+            draw.text((600, 400), self.typed_text[:index % len(self.typed_text)][-80:], fill=(0, 0, 0))
+        elif self.scenario == "scroll":
+            region = self.base.crop((100, 100, 1000, 700))
+            offset = (index * 16) % 600
+            frame.paste(region.crop((0, offset, 900, 600)), (100, 100))
+        elif self.scenario == "video":
+            video_width, video_height = 640, 360
+            noise = random.Random(self.noise_seed * 100003 + index).randbytes(video_width * video_height * 3)
+            frame.paste(Image.frombytes('RGB', (video_width, video_height), noise), (width // 4, height // 4))
+        return frame
+
+    def grab(self, bbox=None):
+        frame = self.frame(self.index)
+        self.index += 1
+        return frame.crop(bbox) if bbox else frame
+
+    def screen_size(self):
+        return self.base.size
+
+    def monitors(self):
+        width, height = self.base.size
+        return [monitor_entry(0, 0, 0, width, height, True, self.name)]
+
+    def cursor(self):
+        """Указатель движется по фигуре Лиссажу, над текстом набора меняет форму на I-beam"""
+        width, height = self.base.size
+        now = time.monotonic()
+        x = int(width / 2 + width / 3 * math.sin(now))
+        y = int(height / 2 + height / 3 * math.sin(1.3 * now))
+        shape = "ibeam" if self.scenario == "typing" and 600 <= x < 1100 and 395 <= y < 425 else "arrow"
+        return x, y, CURSOR_SHAPES.index(shape), True
+
+CAPTURE_SOURCES = {
+    "xshm": XShmSource,
+    "imagegrab": ImageGrabSource,
+    "synthetic": SyntheticSource,
+}
+
+def create_capture_source(name=None):
+    """Источник захвата по CAPTURE_SOURCE; в режиме auto - первый рабочий из xshm и imagegrab"""
+    name = (name or os.environ.get('CAPTURE_SOURCE', 'auto')).lower()
+    candidates = ("xshm", "imagegrab") if name == "auto" else (name,)
+    for candidate in candidates:
+        if candidate not in CAPTURE_SOURCES:
+            raise ValueError(f"Неизвестный источник захвата: {candidate}")
+        try:
+            return CAPTURE_SOURCES[candidate]()
+        except (ImportError, OSError, RuntimeError):
+            if name != "auto":
+                raise
+    return ImageGrabSource()
@@ -4,6 +4,7 @@ import json
 import sys
 import logging
 from datetime import datetime
+from logging_setup import setup_logging
 
 class WebSocketChatClient:
     def __init__(self):
@@ -14,14 +15,7 @@ class WebSocketChatClient:
         
     def setup_logging(self):
         """Настройка логирования для клиента"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler("client.log", encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(log_file="client.log")
         self.logger = logging.getLogger("WebSocketClient")
 
     async def connect_to_server(self, uri):
@@ -145,7 +139,7 @@ def main():
     print("=== 🚀 WebSocket Чат-клиент ===")
     
     # Настройка логирования для main
-    logging.basicConfig(level=logging.INFO)
+    setup_logging(log_file="client.log")
     logger = logging.getLogger("Main")
     
     try:
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+# Общий слой кодека и цикла событий для сервера и обоих клиентов.
+# Быстрые реализации подключаются, только если установлены; иначе используется stdlib.
+# JSON_CODEC=auto|orjson|msgspec|json и EVENT_LOOP=auto|uvloop|asyncio переопределяют выбор.
+
+def _load_orjson():
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumpb(obj):
+        return orjson.dumps(obj)
+
+    return loads, dumpb
+
+def _load_msgspec():
+    import msgspec
+
+    decoder = msgspec.json.Decoder()
+    encoder = msgspec.json.Encoder()
+
+    def loads(data):
+        return decoder.decode(data)
+
+    def dumpb(obj):
+        return encoder.encode(obj)
+
+    return loads, dumpb
+
+def _load_stdlib():
+    def loads(data):
+        return json.loads(data)
+
+    def dumpb(obj):
+        return json.dumps(obj).encode('utf-8')
+
+    return loads, dumpb
+
+JSON_CODECS = {
+    "orjson": _load_orjson,
+    "msgspec": _load_msgspec,
+    "json": _load_stdlib,
+}
+
+def load_json_codec(name=None):
+    """Выбор JSON-кодека: (имя, loads, dumpb)"""
+    name = (name or os.environ.get('JSON_CODEC', 'auto')).lower()
+    candidates = ("orjson", "msgspec", "json") if name == "auto" else (name,)
+    for candidate in candidates:
+        if candidate not in JSON_CODECS:
+            raise ValueError(f"Неизвестный JSON-кодек: {candidate}")
+        try:
+            return (candidate,) + JSON_CODECS[candidate]()
+        except ImportError:
+            if name != "auto":
+                raise
+    return ("json",) + _load_stdlib()
+
+JSON_BACKEND, loads, dumpb = load_json_codec()
+
+if JSON_BACKEND == "json":
+    def dumps(obj):
+        """Сериализация в строку для текстового кадра WebSocket"""
+        return json.dumps(obj)
+else:
+    def dumps(obj):
+        """Сериализация в строку для текстового кадра WebSocket"""
+        return dumpb(obj).decode('utf-8')
+
+def load_event_loop_runner(name=None):
+    """Выбор цикла событий: (имя, функция запуска корутины)"""
+    name = (name or os.environ.get('EVENT_LOOP', 'auto')).lower()
+    if name not in ("auto", "uvloop", "asyncio"):
+        raise ValueError(f"Неизвестный цикл событий: {name}")
+    if name != "asyncio":
+        try:
+            import uvloop
+            return "uvloop", uvloop.run
+        except ImportError:
+            if name == "uvloop":
+                raise
+    return "asyncio", asyncio.run
+
+LOOP_BACKEND, _run = load_event_loop_runner()
+
+def run(main):
+    """Запуск корутины на выбранном цикле событий (аналог asyncio.run)"""
+    return _run(main)
+
+def describe():
+    return f"JSON: {JSON_BACKEND}, цикл событий: {LOOP_BACKEND}"
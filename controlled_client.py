@@ -1,18 +1,55 @@
 import asyncio
 import websockets
-import json
+import codec
 import sys
+import os
 import logging
-import base64
-import io
-from PIL import ImageGrab, Image
-import pyautogui
+from PIL import Image
 from datetime import datetime
+from capture_scheduler import CaptureScheduler
+from capture_sources import create_capture_source
+from cursor_tracker import CursorTracker
+from frame_delta import TileDiffer, delta_enabled
+from frame_encoders import create_encoder
+from frame_protocol import encode_cursor, encode_delta, encode_keyframe, geometry_message, session_tag
+from input_executor import InputExecutor
+from logging_setup import setup_logging
+from monitors import desktop_bounds
+from stream_control import BitrateController, FrameWindow, adaptive_enabled
+from ws_compression import client_compression_options
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Без pyautogui (нет дисплея, не установлен) клиент только передает экран, команды ввода игнорируются
+try:
+    import pyautogui
+except Exception:
+    pyautogui = None
+
+# Частота опроса указателя для канала указателя, Гц (CURSOR_RATE=0 отключает канал)
+DEFAULT_CURSOR_RATE = 60.0
+
+# Режимы масштабирования (CAPTURE_RESAMPLE): фильтр и reducing_gap для Image.resize.
+# С reducing_gap Pillow сначала уменьшает кадр целочисленным reduce(), это в разы быстрее LANCZOS.
+# BOX усредняет пиксели и для уменьшения почти не уступает BILINEAR; NEAREST - для самых слабых машин
+RESAMPLE_MODES = {
+    "quality": (Image.Resampling.LANCZOS, None),
+    "balanced": (Image.Resampling.BILINEAR, 2.0),
+    "fast": (Image.Resampling.BOX, 1.0),
+    "nearest": (Image.Resampling.NEAREST, None),
+}
+DEFAULT_RESAMPLE_MODE = "balanced"
+# Допустимый масштаб области set_viewport: больше родного нет смысла, меньше - нечитаемо
+MIN_VIEWPORT_ZOOM = 0.1
+MAX_VIEWPORT_ZOOM = 4.0
 
 class RemoteControlledClient:
-    def __init__(self):
+    def __init__(self, session_id="default"):
         self.websocket = None
+        self.session_id = session_id
+        self.session_tag = session_tag(session_id)
+        # Номер последнего закодированного кадра
+        self.frame_id = 0
         self.client_id = f"controlled_{datetime.now().strftime('%H%M%S')}"
         self.connected = False
         self.screen_capturing = False
@@ -20,150 +57,492 @@ class RemoteControlledClient:
         self.screen_task = None
         self.target_width = 1920
         self.target_height = 1080
+        # Черные поля до 1920x1080 вокруг кадра (CAPTURE_LETTERBOX=1) или кадр своего размера
+        self.letterbox = os.environ.get('CAPTURE_LETTERBOX', '0') == '1'
+        self.resample_mode = os.environ.get('CAPTURE_RESAMPLE', DEFAULT_RESAMPLE_MODE)
+        if self.resample_mode not in RESAMPLE_MODES:
+            raise ValueError(f"Неизвестный режим масштабирования: {self.resample_mode}")
+        # Геометрия кадра пересчитывается только при смене разрешения источника
+        self.layout_source_size = None
+        self.scaled_size = None
+        self.letterbox_canvas = None
+        # Доля целевого разрешения, которую выбирает адаптация потока
+        self.output_scale = 1.0
+        self.layout_scale = None
+        # Область экрана (x, y, ширина, высота, масштаб), которую смотрит управляющий; None - весь экран.
+        # Масштаб по умолчанию 1.0 (родное разрешение). Область и масштаб меняются одним присваиванием,
+        # и конвейер читает их вместе один раз на кадр
+        self.viewport = None
+        self.layout_viewport = None
+        # Источник кадров (CAPTURE_SOURCE, capture_sources.CAPTURE_SOURCES)
+        self.capture_source = create_capture_source()
+        # Мониторы источника и выбранный из них; None - весь захват по умолчанию
+        self.monitors = self.capture_source.monitors()
+        self.desktop_bounds = desktop_bounds(self.monitors)
+        self.monitor_index = None
+        # Канал указателя: положение и форма отправляются чаще кадров отдельными короткими сообщениями
+        self.cursor_tracker = CursorTracker(self.capture_source)
+        self.cursor_rate = float(os.environ.get('CURSOR_RATE', DEFAULT_CURSOR_RATE))
+        self.cursor_task = None
+        self.cursor_sequence = 0
+        # Ввод выполняется в своем потоке, чтобы не задерживать кадры и прием команд
+        self.input_executor = InputExecutor(pyautogui) if pyautogui is not None else None
+        self.frame_geometry = None
+        self.geometry_epoch = 0
+        self.geometry_sent = False
+        # Формат сжатия кадров (FRAME_ENCODER, frame_encoders.ENCODER_PRESETS)
+        self.encoder = create_encoder()
+        self.base_quality = getattr(self.encoder, 'quality', None)
+        # Частота захвата по активности экрана и ввода
+        self.capture_scheduler = CaptureScheduler()
+        self.base_max_fps = self.capture_scheduler.max_fps
+        # Адаптация качества, разрешения и FPS к каналу (stream_control.BitrateController)
+        self.bitrate_controller = None
+        # Ограничение кадров, отправленных без подтверждения показа (stream_control.FrameWindow)
+        self.frame_window = None
+        # Поиск изменившихся плиток для дельта-кадров (frame_delta.TileDiffer)
+        self.tile_differ = None
         self.setup_logging()
         
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler("controlled.log", encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(log_file="controlled.log")
         self.logger = logging.getLogger("RemoteControlled")
 
-    def capture_screen(self):
-        """Захват всего экрана и масштабирование с сохранением всех элементов"""
-        try:
-            # Захватываем скриншот всего экрана
-            screenshot = ImageGrab.grab()
-            original_width, original_height = screenshot.size
-            
-            self.logger.debug(f"🖥️ Исходное разрешение: {original_width}x{original_height}")
-            
-            # Масштабируем изображение так, чтобы ВЕСЬ экран поместился в 1920x1080
-            # Вычисляем коэффициенты масштабирования
-            width_ratio = self.target_width / original_width
-            height_ratio = self.target_height / original_height
-            
-            # Используем МЕНЬШИЙ коэффициент, чтобы ВЕСЬ экран поместился
-            scale_ratio = min(width_ratio, height_ratio)
-            
-            # Вычисляем новые размеры
-            new_width = int(original_width * scale_ratio)
-            new_height = int(original_height * scale_ratio)
-            
-            # Масштабируем изображение с высоким качеством
-            resized_screenshot = screenshot.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Создаем черный фон целевого размера
-            final_image = Image.new('RGB', (self.target_width, self.target_height), (0, 0, 0))
-            
-            # Вычисляем позицию для центрирования изображения
-            x_offset = (self.target_width - new_width) // 2
-            y_offset = (self.target_height - new_height) // 2
-            
-            # Вставляем масштабированное изображение в центр
-            final_image.paste(resized_screenshot, (x_offset, y_offset))
-            
-            # Конвертируем в base64
-            buffer = io.BytesIO()
-            final_image.save(buffer, format='JPEG', quality=85, optimize=True)
-            image_data = buffer.getvalue()
-            
-            self.logger.debug(f"📸 Весь экран масштабирован: {original_width}x{original_height} -> {new_width}x{new_height}")
-            
-            # Возвращаем также параметры масштабирования для корректной работы мыши
-            return {
-                'image_data': base64.b64encode(image_data).decode('utf-8'),
-                'original_width': original_width,
-                'original_height': original_height,
-                'scaled_width': new_width,
-                'scaled_height': new_height,
-                'offset_x': x_offset,
-                'offset_y': y_offset,
-                'scale_ratio': scale_ratio
-            }
-            
-        except Exception as e:
-            self.logger.error(f"❌ Ошибка захвата экрана: {e}")
-            import traceback
-            self.logger.error(f"🔍 Подробности: {traceback.format_exc()}")
-            return None
+    def grab_screen(self, viewport=None):
+        """Захват всего экрана или области viewport (выполняется в потоке захвата)"""
+        if viewport is None:
+            return self.capture_source.grab()
+        x, y, width, height = viewport[:4]
+        return self.capture_source.grab((x, y, x + width, y + height))
+
+    def set_viewport(self, data):
+        """Команда set_viewport: область экрана в его пикселях; пустые данные - снова весь экран"""
+        if self.tile_differ:
+            # Старый кадр к новой области не относится
+            self.tile_differ.request_keyframe()
+        if not data:
+            self.viewport = None
+            self.logger.info("🖥️ Передается весь экран")
+            return
+        zoom = float(data.get('zoom') or 1.0)
+        if not zoom > 0:
+            # Отрицательный масштаб и NaN сломали бы масштабирование каждого следующего кадра
+            raise ValueError(f"Недопустимый масштаб области: {data.get('zoom')}")
+        left, top, right, bottom = self.desktop_bounds
+        x = max(left, min(int(data['x']), right - 1))
+        y = max(top, min(int(data['y']), bottom - 1))
+        width = max(1, min(int(data['width']), right - x))
+        height = max(1, min(int(data['height']), bottom - y))
+        zoom = max(MIN_VIEWPORT_ZOOM, min(zoom, MAX_VIEWPORT_ZOOM))
+        self.viewport = (x, y, width, height, zoom)
+        self.logger.info(f"🔍 Передается область {width}x{height} с ({x}, {y}), масштаб {zoom:g}")
+
+    def select_monitor(self, data):
+        """Команда select_monitor: захват только одного монитора; пустые данные - снова весь экран
+
+        Монитор передается как область set_viewport по его границам, поэтому
+        захватываются и кодируются только его пиксели, а координаты мыши
+        смещаются на его положение на общем рабочем столе.
+        """
+        index = data.get('index') if data else None
+        if index is None:
+            self.monitor_index = None
+            self.set_viewport(None)
+            return
+        if not 0 <= index < len(self.monitors):
+            raise ValueError(f"Нет монитора {index}")
+        monitor = self.monitors[index]
+        self.monitor_index = index
+        self.set_viewport(monitor)
+        self.logger.info(f"🖵 Выбран монитор {index} ({monitor['name']}): {monitor['width']}x{monitor['height']}")
+
+    def refresh_monitors(self):
+        """Повторное перечисление мониторов после смены разрешения; границы для мыши берутся отсюда"""
+        monitors = self.capture_source.monitors()
+        if monitors == self.monitors:
+            return
+        self.monitors = monitors
+        self.desktop_bounds = desktop_bounds(monitors)
+        if self.monitor_index is not None and self.monitor_index >= len(monitors):
+            self.monitor_index = None
+        self.logger.info(f"🖵 Рабочий стол изменился: {len(monitors)} мон., границы {self.desktop_bounds}")
+
+    def update_layout(self, source_size, viewport=None):
+        """Пересчет размеров и смещений кадра; выполняется только при смене источника, области или доли"""
+        original_width, original_height = source_size
+        scale = self.output_scale
+        target_width = int(self.target_width * scale)
+        target_height = int(self.target_height * scale)
+        
+        # Масштабируем изображение так, чтобы ВЕСЬ экран поместился в 1920x1080 (или его долю)
+        # Вычисляем коэффициенты масштабирования
+        width_ratio = target_width / original_width
+        height_ratio = target_height / original_height
+        
+        # Используем МЕНЬШИЙ коэффициент, чтобы ВЕСЬ экран поместился
+        scale_ratio = min(width_ratio, height_ratio)
+        if viewport is not None:
+            # Область передается в родном (или запрошенном) разрешении, пока помещается в кадр:
+            # трафик пропорционален площади области, мелкий текст остается читаемым
+            scale_ratio = min(scale_ratio, viewport[4])
+        if viewport is not None:
+            origin_x, origin_y = viewport[:2]
+        elif source_size == (self.desktop_bounds[2] - self.desktop_bounds[0],
+                             self.desktop_bounds[3] - self.desktop_bounds[1]):
+            # Захвачен весь рабочий стол всех мониторов: кадр начинается с его левого верхнего угла
+            origin_x, origin_y = self.desktop_bounds[:2]
+        else:
+            origin_x, origin_y = 0, 0
+        
+        # Вычисляем новые размеры
+        new_width = max(1, int(original_width * scale_ratio))
+        new_height = max(1, int(original_height * scale_ratio))
+        
+        if self.letterbox:
+            # Черный фон целевого размера создается один раз, кадр вставляется в центр
+            x_offset = (target_width - new_width) // 2
+            y_offset = (target_height - new_height) // 2
+            self.letterbox_canvas = Image.new('RGB', (target_width, target_height), (0, 0, 0))
+        else:
+            x_offset = y_offset = 0
+            self.letterbox_canvas = None
+        
+        self.layout_source_size = source_size
+        self.layout_scale = scale
+        self.layout_viewport = viewport
+        self.scaled_size = (new_width, new_height)
+        # Параметры масштабирования нужны для корректной работы мыши
+        self.frame_geometry = {
+            'original_width': original_width,
+            'original_height': original_height,
+            'scaled_width': new_width,
+            'scaled_height': new_height,
+            'offset_x': x_offset,
+            'offset_y': y_offset,
+            'scale_ratio': scale_ratio,
+            # Левый верхний угол области на экране: для пересчета координат мыши
+            'origin_x': origin_x,
+            'origin_y': origin_y
+        }
+        self.geometry_epoch += 1
+        self.geometry_sent = False
+        
+        if viewport is None:
+            self.logger.info(f"📐 Весь экран масштабируется: {original_width}x{original_height} -> {new_width}x{new_height}")
+        else:
+            self.logger.info(
+                f"📐 Область с ({origin_x}, {origin_y}) масштабируется: "
+                f"{original_width}x{original_height} -> {new_width}x{new_height}"
+            )
+
+    def compose_frame(self, screenshot, viewport=None):
+        """Масштабирование скриншота (всего экрана или области viewport) с сохранением всех элементов"""
+        if (screenshot.size != self.layout_source_size or self.output_scale != self.layout_scale
+                or viewport != self.layout_viewport):
+            if viewport is None and self.layout_viewport is None and self.layout_source_size is not None \
+                    and screenshot.size != self.layout_source_size:
+                # Размер всего экрана изменился - сменилось разрешение или набор мониторов
+                self.refresh_monitors()
+            self.update_layout(screenshot.size, viewport)
+        if screenshot.mode != 'RGB':
+            screenshot = screenshot.convert('RGB')
+        
+        if screenshot.size == self.scaled_size:
+            frame = screenshot
+        else:
+            resample, reducing_gap = RESAMPLE_MODES[self.resample_mode]
+            frame = screenshot.resize(self.scaled_size, resample, reducing_gap=reducing_gap)
+        
+        if self.letterbox_canvas is None:
+            return frame
+        self.letterbox_canvas.paste(frame, (self.frame_geometry['offset_x'], self.frame_geometry['offset_y']))
+        return self.letterbox_canvas
+
+    def encode_frame_messages(self, screenshot, timestamp, viewport=None):
+        """Готовые сообщения кадра из скриншота (выполняется в потоке кодирования)
+
+        При включенных дельтах отправляются только изменившиеся плитки,
+        опорный кадр - первым, периодически и по запросу request_keyframe.
+        Перед кадром с новой геометрией отправляется screen_geometry.
+        Если экран не изменился, список пуст.
+        """
+        frame = self.compose_frame(screenshot, viewport)
+        messages = []
+        if not self.geometry_sent:
+            messages.append(codec.dumps(geometry_message(self.geometry_epoch, self.frame_geometry)))
+            self.geometry_sent = True
+        
+        rects = self.tile_differ.diff(frame) if self.tile_differ else None
+        self.frame_id += 1
+        encoder = self.encoder
+        if rects is None:
+            messages.append(encode_keyframe(
+                self.session_tag, self.frame_id, timestamp, self.geometry_epoch, encoder.encode(frame), encoder.codec
+            ))
+        elif rects:
+            tiles = [
+                (x, y, encoder.encode(frame.crop((x, y, x + width, y + height))))
+                for x, y, width, height in rects
+            ]
+            messages.append(encode_delta(
+                self.session_tag, self.frame_id, timestamp, self.geometry_epoch, tiles, encoder.codec
+            ))
+        return messages
+
+    def apply_stream_settings(self):
+        """Перенос ступени адаптации в кодировщик, масштабирование и планировщик захвата"""
+        if self.bitrate_controller is None:
+            quality, scale, fps = self.base_quality, 1.0, self.base_max_fps
+        else:
+            # Ступени задаются относительно настроек: на лучшей поток идет ровно с ними
+            settings = self.bitrate_controller.settings(self.base_quality, self.base_max_fps)
+            quality, scale, fps = settings["quality"], settings["scale"], settings["fps"]
+        # Для WebP без потерь quality - усилие сжатия, его не трогаем
+        if self.base_quality is not None and not getattr(self.encoder, 'lossless', False):
+            self.encoder.quality = quality
+        # Геометрия пересчитается на следующем кадре в потоке кодирования
+        self.output_scale = scale
+        self.capture_scheduler.set_max_fps(fps)
+
+    def buffered_bytes(self):
+        """Байты, которые еще лежат в буфере отправки сокета"""
+        transport = getattr(self.websocket, 'transport', None)
+        return transport.get_write_buffer_size() if transport else 0
+
+    def stream_settings(self):
+        """Текущие параметры потока для status_update"""
+        controller = self.bitrate_controller
+        settings = {
+            "adaptive": controller is not None,
+            "encoder": self.encoder.describe(),
+            "scale": self.output_scale,
+            "fps": round(self.capture_scheduler.max_fps, 1),
+        }
+        if controller:
+            settings.update({
+                "level": controller.level,
+                "latency_ms": round(1000 * controller.latency()),
+                "kbps": round(controller.kbps()),
+            })
+        window = self.frame_window
+        if window and window.ack_latency is not None:
+            settings["ack_latency_ms"] = round(1000 * window.ack_latency)
+        return settings
+
+    def describe_stream(self):
+        settings = self.stream_settings()
+        text = f"Поток: {settings['encoder']}, {settings['scale']:.0%} разрешения, до {settings['fps']:g} FPS"
+        if settings["adaptive"]:
+            text += f" (задержка {settings['latency_ms']} мс, {settings['kbps']} кбит/с)"
+        if "ack_latency_ms" in settings:
+            text += f", до показа {settings['ack_latency_ms']} мс"
+        return text
+
+    async def report_stream(self):
+        """Параметры потока в лог и управляющему"""
+        text = self.describe_stream()
+        self.logger.info(f"📶 {text}")
+        await self.send_status(text, stream=self.stream_settings())
 
     async def send_screen_updates(self):
-        """Отправка обновлений экрана"""
+        """Отправка обновлений экрана конвейером: захват, кодирование и отправка идут параллельно
+
+        Пока кадр N отправляется, кадр N+1 кодируется, а кадр N+2 захватывается,
+        поэтому частота кадров ограничена самой медленной стадией, а не их суммой.
+        Очереди между стадиями на один кадр: захват ждет, пока кодировщик освободится.
+        """
         self.logger.info("🔄 Начало передачи ВСЕГО экрана")
         
-        frame_count = 0
-        start_time = time.time()
+        # Новая передача всегда начинается с геометрии и полного кадра
+        self.tile_differ = TileDiffer() if delta_enabled() else None
+        self.geometry_sent = False
+        # Адаптация тоже начинается заново с лучшей ступени
+        self.bitrate_controller = BitrateController() if adaptive_enabled() else None
+        self.frame_window = FrameWindow()
+        self.apply_stream_settings()
+        await self.report_stream()
+        loop = asyncio.get_running_loop()
+        captured = asyncio.Queue(maxsize=1)
+        encoded = asyncio.Queue(maxsize=1)
+        # Отдельные потоки, чтобы захват и кодирование шли одновременно; Pillow отпускает GIL
+        capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        encode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+        stage_seconds = {"capture": 0.0, "encode": 0.0, "send": 0.0}
         
-        while self.screen_capturing and self.connected:
-            try:
+        async def capture_stage():
+            scheduler = self.capture_scheduler
+            scheduler.mark_activity()
+            was_idle = False
+            while self.screen_capturing and self.connected:
+                # Регулируем FPS по активности
+                await scheduler.wait_next()
+                # Пока управляющий не показал отправленные кадры, новый не захватываем
+                if not await self.frame_window.wait_open():
+                    self.logger.warning(
+                        "⏳ Нет подтверждений показа кадров, отправка продолжается без них",
+                        extra={"event": "frame_ack_timeout"}
+                    )
+                if scheduler.is_idle() != was_idle:
+                    was_idle = scheduler.is_idle()
+                    if was_idle:
+                        self.logger.info("💤 Экран не меняется, захват замедляется")
+                    else:
+                        self.logger.info(f"⚡ Активность, захват {scheduler.fps():.0f} FPS")
+                
                 frame_start = time.time()
+                started = time.perf_counter()
+                # Область читается один раз: захват и геометрия кадра должны ей соответствовать
+                viewport = self.viewport
+                try:
+                    screenshot = await loop.run_in_executor(capture_executor, self.grab_screen, viewport)
+                except Exception as e:
+                    self.logger.error(f"❌ Ошибка захвата экрана: {e}")
+                    await asyncio.sleep(0.5)
+                    continue
+                stage_seconds["capture"] += time.perf_counter() - started
+                await captured.put((screenshot, viewport, frame_start))
+        
+        async def encode_stage():
+            while True:
+                screenshot, viewport, frame_start = await captured.get()
+                started = time.perf_counter()
+                try:
+                    messages = await loop.run_in_executor(
+                        encode_executor, self.encode_frame_messages, screenshot, frame_start, viewport
+                    )
+                except Exception as e:
+                    self.logger.error(f"❌ Ошибка кодирования кадра: {e}")
+                    continue
+                stage_seconds["encode"] += time.perf_counter() - started
+                # Без поиска дельт изменения экрана не видны, поэтому каждый кадр считается новым
+                self.capture_scheduler.frame_done(self.tile_differ.changed if self.tile_differ else True)
+                if messages:
+                    # Номер читается до следующего кодирования, стадия кодирует кадры по одному
+                    await encoded.put((self.frame_id, messages))
+        
+        async def send_stage():
+            frame_count = 0
+            start_time = time.time()
+            while self.websocket:
+                frame_id, messages = await encoded.get()
+                # Кадр учитывается в окне до отправки: подтверждение может прийти раньше, чем send() вернется
+                self.frame_window.frame_sent(frame_id)
+                started = time.perf_counter()
+                for message in messages:
+                    await self.websocket.send(message)
+                send_seconds = time.perf_counter() - started
+                stage_seconds["send"] += send_seconds
+                frame_count += 1
                 
-                capture_result = self.capture_screen()
-                if capture_result and self.websocket:
-                    await self.websocket.send(json.dumps({
-                        "type": "screen_data",
-                        "screen_data": capture_result['image_data'],
-                        "original_width": capture_result['original_width'],
-                        "original_height": capture_result['original_height'],
-                        "scaled_width": capture_result['scaled_width'],
-                        "scaled_height": capture_result['scaled_height'],
-                        "offset_x": capture_result['offset_x'],
-                        "offset_y": capture_result['offset_y'],
-                        "scale_ratio": capture_result['scale_ratio'],
-                        "timestamp": frame_start
-                    }))
-                    frame_count += 1
-                    
-                    if frame_count % 30 == 0:
-                        elapsed = time.time() - start_time
-                        fps = frame_count / elapsed
-                        self.logger.info(f"📊 Статистика: {frame_count} кадров, {fps:.1f} FPS")
+                controller = self.bitrate_controller
+                if controller:
+                    controller.frame_sent(sum(len(message) for message in messages), send_seconds, self.buffered_bytes())
+                    if controller.adjust():
+                        self.apply_stream_settings()
+                        await self.report_stream()
                 
-                # Регулируем FPS
-                elapsed_frame = time.time() - frame_start
-                target_fps = 10
-                sleep_time = max(1.0/target_fps - elapsed_frame, 0.01)
-                await asyncio.sleep(sleep_time)
-                    
-            except asyncio.CancelledError:
-                self.logger.info("🛑 Передача экрана прервана")
-                break
-            except websockets.exceptions.ConnectionClosed:
-                self.logger.warning("🔌 Соединение закрыто во время отправки экрана")
-                break
-            except Exception as e:
-                self.logger.error(f"❌ Ошибка отправки экрана: {e}")
-                await asyncio.sleep(0.5)
+                if frame_count % 30 == 0:
+                    elapsed = time.time() - start_time
+                    fps = frame_count / elapsed
+                    average = {name: 1000 * seconds / frame_count for name, seconds in stage_seconds.items()}
+                    self.logger.info(
+                        f"📊 Статистика: {frame_count} кадров, {fps:.1f} FPS (захват {average['capture']:.0f} мс, "
+                        f"кодирование {average['encode']:.0f} мс, отправка {average['send']:.0f} мс)"
+                    )
+        
+        tasks = [asyncio.create_task(stage()) for stage in (capture_stage, encode_stage, send_stage)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        except asyncio.CancelledError:
+            self.logger.info("🛑 Передача экрана прервана")
+        except websockets.exceptions.ConnectionClosed:
+            self.logger.warning("🔌 Соединение закрыто во время отправки экрана")
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка отправки экрана: {e}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            capture_executor.shutdown(wait=False)
+            encode_executor.shutdown(wait=False)
+
+    async def send_cursor_updates(self):
+        """Канал указателя: положение и форма с частотой до CURSOR_RATE, только при изменении
+
+        Указатель не ждет кадров: управляющий рисует его поверх последнего кадра,
+        поэтому движение видно сразу, даже когда экран передается с низким FPS.
+        """
+        self.logger.info(f"🖱️ Канал указателя: {self.cursor_tracker.name}, до {self.cursor_rate:g} Гц")
+        interval = 1.0 / self.cursor_rate
+        last = None
+        try:
+            while self.screen_capturing and self.connected and self.websocket:
+                cursor = self.cursor_tracker.read()
+                if cursor is not None and cursor != last:
+                    last = cursor
+                    x, y, shape, visible = cursor
+                    self.cursor_sequence += 1
+                    await self.websocket.send(encode_cursor(self.session_tag, self.cursor_sequence, x, y, shape, visible))
+                    # Движение указателя обычно сопровождается изменениями экрана
+                    self.capture_scheduler.mark_activity()
+                await asyncio.sleep(interval)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка канала указателя: {e}")
 
     async def execute_command(self, command, data=None):
         """Выполнение команд от управляющего клиента"""
         try:
-            self.logger.info(f"🔧 Выполнение команды: {command}")
+            # Движения мыши приходят десятками в секунду, в лог попадает только часть
+            event = "mouse_move" if command == "mouse_move" else None
+            self.logger.info(f"🔧 Выполнение команды: {command}", extra={"event": event})
+            
+            if command and (command.startswith(("mouse_", "key_")) or command in ("type_write", "request_keyframe", "set_viewport", "select_monitor")):
+                # Ввод меняет экран: следующий кадр захватываем сразу
+                self.capture_scheduler.mark_activity(wake=True)
+            
+            if pyautogui is None and command and command.startswith(("mouse_", "key_", "type_")):
+                self.logger.warning("⚠️ Ввод недоступен: pyautogui не загружен", extra={"event": "input_unavailable"})
+                return
             
             if command == "capture_screen":
                 if not self.screen_capturing:
                     self.screen_capturing = True
                     self.screen_task = asyncio.create_task(self.send_screen_updates())
+                    if self.cursor_tracker.available() and self.cursor_rate > 0:
+                        self.cursor_task = asyncio.create_task(self.send_cursor_updates())
                     await self.send_status("Захват ВСЕГО экрана активирован")
                     
             elif command == "stop_capture":
                 if self.screen_capturing:
                     self.screen_capturing = False
-                    if self.screen_task:
-                        self.screen_task.cancel()
-                        try:
-                            await self.screen_task
-                        except asyncio.CancelledError:
-                            pass
+                    for task in (self.screen_task, self.cursor_task):
+                        if task:
+                            task.cancel()
+                            try:
+                                await task
+                            except asyncio.CancelledError:
+                                pass
                     await self.send_status("Захват экрана остановлен")
                     
+            elif command == "set_viewport":
+                self.set_viewport(data)
+                
+            elif command == "select_monitor":
+                self.select_monitor(data)
+                
+            elif command == "request_keyframe":
+                if self.tile_differ:
+                    self.tile_differ.request_keyframe()
+                    
             elif command == "toggle_mouse_control":
                 self.mouse_control = not self.mouse_control
+                if not self.mouse_control and self.input_executor:
+                    # Ввод, поставленный в очередь до отключения, выполняться не должен
+                    self.input_executor.clear()
                 status = "активировано" if self.mouse_control else "деактивировано"
                 await self.send_status(f"Управление мышью {status}")
                 
@@ -180,20 +559,17 @@ class RemoteControlledClient:
                 await self.handle_mouse_command("up", data)
                 
             elif command == "key_press" and self.mouse_control:
-                key = data['key']
-                pyautogui.press(key, _pause=False)
+                self.input_executor.submit("press", data['key'])
                 
             elif command == "key_down" and self.mouse_control:
-                key = data['key']
-                pyautogui.keyDown(key, _pause=False)
+                self.input_executor.submit("keyDown", data['key'])
                 
             elif command == "key_up" and self.mouse_control:
-                key = data['key']
-                pyautogui.keyUp(key, _pause=False)
+                self.input_executor.submit("keyUp", data['key'])
                 
             elif command == "type_write" and self.mouse_control:
-                text = data['text']
-                pyautogui.write(text, interval=0.01, _pause=False)
+                # Паузы между символами выдерживает поток ввода, цикл событий не ждет
+                self.input_executor.submit("write", data['text'], interval=0.01)
                 
             else:
                 if self.mouse_control:
@@ -212,6 +588,8 @@ class RemoteControlledClient:
             scale_ratio = data.get('scale_ratio', 1.0)
             offset_x = data.get('offset_x', 0)
             offset_y = data.get('offset_y', 0)
+            origin_x = data.get('origin_x', 0)
+            origin_y = data.get('origin_y', 0)
             scaled_width = data.get('scaled_width', self.target_width)
             scaled_height = data.get('scaled_height', self.target_height)
             
@@ -225,38 +603,41 @@ class RemoteControlledClient:
                 return  # Клик в черных полосах - игнорируем
             
             # Преобразуем координаты из масштабированного изображения в реальные
-            local_x = int((remote_x - offset_x) / scale_ratio)
-            local_y = int((remote_y - offset_y) / scale_ratio)
+            local_x = origin_x + int((remote_x - offset_x) / scale_ratio)
+            local_y = origin_y + int((remote_y - offset_y) / scale_ratio)
             
-            # Получаем реальное разрешение экрана для проверки границ
-            screen_width, screen_height = pyautogui.size()
-            local_x = max(0, min(local_x, screen_width - 1))
-            local_y = max(0, min(local_y, screen_height - 1))
+            # Проверяем границы общего рабочего стола всех мониторов
+            left, top, right, bottom = self.desktop_bounds
+            local_x = max(left, min(local_x, right - 1))
+            local_y = max(top, min(local_y, bottom - 1))
             
-            # Выполняем действие
+            # Ставим действие в очередь потока ввода; подряд идущие движения схлопываются
             button = data.get('button', 'left')
             
             if action == "move":
-                pyautogui.moveTo(local_x, local_y, _pause=False)
+                self.input_executor.submit("moveTo", local_x, local_y)
             elif action == "click":
-                pyautogui.click(local_x, local_y, button=button, _pause=False)
+                self.input_executor.submit("click", local_x, local_y, button=button)
             elif action == "down":
-                pyautogui.mouseDown(local_x, local_y, button=button, _pause=False)
+                self.input_executor.submit("mouseDown", local_x, local_y, button=button)
             elif action == "up":
-                pyautogui.mouseUp(local_x, local_y, button=button, _pause=False)
+                self.input_executor.submit("mouseUp", local_x, local_y, button=button)
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка обработки команды мыши: {e}")
 
-    async def send_status(self, status_message):
-        """Отправка статуса управляющему"""
+    async def send_status(self, status_message, stream=None):
+        """Отправка статуса управляющему; stream - текущие параметры потока экрана"""
         if self.websocket and self.connected:
+            status = {
+                "type": "status_update",
+                "status": "info",
+                "info": status_message
+            }
+            if stream is not None:
+                status["stream"] = stream
             try:
-                await self.websocket.send(json.dumps({
-                    "type": "status_update",
-                    "status": "info",
-                    "info": status_message
-                }))
+                await self.websocket.send(codec.dumps(status))
             except Exception as e:
                 self.logger.error(f"❌ Ошибка отправки статуса: {e}")
 
@@ -271,17 +652,20 @@ class RemoteControlledClient:
                     ping_interval=30,
                     ping_timeout=10,
                     close_timeout=5,
-                    max_size=10 * 1024 * 1024
+                    max_size=10 * 1024 * 1024,
+                    **client_compression_options()
                 )
                 
-                await self.websocket.send(json.dumps({
+                await self.websocket.send(codec.dumps({
                     "type": "controlled",
                     "client_id": self.client_id,
-                    "resolution": f"{self.target_width}x{self.target_height}"
+                    "session_id": self.session_id,
+                    "resolution": f"{self.target_width}x{self.target_height}",
+                    "monitors": self.monitors
                 }))
                 
                 message = await asyncio.wait_for(self.websocket.recv(), timeout=10.0)
-                data = json.loads(message)
+                data = codec.loads(message)
                 
                 if data.get("type") == "connection_established":
                     self.connected = True
@@ -300,11 +684,24 @@ class RemoteControlledClient:
         """Прием команд от сервера"""
         try:
             async for message in self.websocket:
-                data = json.loads(message)
+                data = codec.loads(message)
                 
                 if data["type"] == "execute_command":
                     await self.execute_command(data["command"], data.get("data"))
                     
+                elif data["type"] == "frame_ack":
+                    if self.frame_window:
+                        self.frame_window.ack(data.get("frame_id", 0))
+                        
+                elif data["type"] == "controller_connected":
+                    # Окно кадров включится с первым подтверждением управляющего
+                    self.logger.info("🎮 Управляющий подключен")
+                    
+                elif data["type"] == "controller_disconnected":
+                    self.logger.info("🎮 Управляющий отключен, кадры идут без подтверждений")
+                    if self.frame_window:
+                        self.frame_window.deactivate()
+                    
                 elif data["type"] == "error":
                     self.logger.error(f"❌ Ошибка от сервера: {data.get('message', '')}")
                     
@@ -317,6 +714,12 @@ class RemoteControlledClient:
 
     async def start(self, uri):
         """Основной цикл клиента"""
+        self.logger.info(f"⚙️ {codec.describe()}, захват: {self.capture_source.name}")
+        self.logger.info("🖵 Мониторы: " + ", ".join(
+            f"{monitor['index']}: {monitor['width']}x{monitor['height']} с ({monitor['x']}, {monitor['y']})"
+            + (" основной" if monitor['primary'] else "")
+            for monitor in self.monitors
+        ))
         if not await self.connect_to_server(uri):
             self.logger.error("❌ Не удалось подключиться к серверу")
             return
@@ -327,6 +730,8 @@ class RemoteControlledClient:
         print("⚠️  ВНИМАНИЕ: После активации управления ваш компьютер будет управляться удаленно!")
         print("-" * 50)
         
+        if self.input_executor:
+            self.input_executor.start()
         try:
             await self.receive_commands()
         except Exception as e:
@@ -338,6 +743,14 @@ class RemoteControlledClient:
             
             if self.screen_task:
                 self.screen_task.cancel()
+            if self.cursor_task:
+                self.cursor_task.cancel()
+            if self.input_executor:
+                self.input_executor.stop()
+                self.logger.info(
+                    f"🖱️ Ввод: выполнено {self.input_executor.executed}, "
+                    f"схлопнуто движений {self.input_executor.coalesced}"
+                )
                 
             if self.websocket:
                 await self.websocket.close()
@@ -347,7 +760,7 @@ class RemoteControlledClient:
 def main():
     print("=== 🖥️ Управляемый клиент ===")
     
-    logging.basicConfig(level=logging.INFO)
+    setup_logging(log_file="controlled.log")
     logger = logging.getLogger("Main")
     
     try:
@@ -364,8 +777,12 @@ def main():
             uri = f"wss://{domain}"
             logger.info(f"🌐 Удаленное подключение: {uri}")
 
-        client = RemoteControlledClient()
-        asyncio.run(client.start(uri))
+        # Идентификатор сессии: второй аргумент или переменная окружения
+        session_id = sys.argv[2] if len(sys.argv) > 2 else os.environ.get('REMOTE_SESSION_ID', 'default')
+        logger.info(f"🔑 Сессия: {session_id}")
+
+        client = RemoteControlledClient(session_id=session_id)
+        codec.run(client.start(uri))
         
     except KeyboardInterrupt:
         logger.info("🛑 Клиент остановлен пользователем")
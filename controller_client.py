@@ -1,20 +1,44 @@
 import asyncio
 import websockets
-import json
+import codec
 import sys
+import os
 import logging
-import base64
 import tkinter as tk
 from PIL import Image, ImageTk
 import io
 from datetime import datetime
+from frame_protocol import (
+    CODEC_FORMATS, CURSOR_SHAPES, CURSOR_VISIBLE, FRAME_KEY, decode_cursor, decode_header, decode_tiles,
+    frame_payload, is_cursor_message
+)
+from logging_setup import EventSampler, sample_interval, setup_logging
+from ws_compression import client_compression_options
 import threading
 import queue
 import time
 
+# Пункт меню мониторов для захвата всего экрана
+ALL_MONITORS_LABEL = "Все мониторы"
+
+# Контуры указателя поверх экрана (точки относительно острия) и какие формы ими рисуются
+CURSOR_OUTLINES = {
+    "arrow": [(0, 0), (0, 16), (4, 12), (7, 19), (10, 18), (7, 11), (12, 11)],
+    "ibeam": [(-3, -8), (3, -8), (0, -8), (0, 8), (-3, 8), (3, 8)],
+    "cross": [(-8, 0), (8, 0), (0, 0), (0, -8), (0, 8)],
+    "wait": [(-6, -6), (6, -6), (-6, 6), (6, 6), (-6, -6)],
+}
+CURSOR_OUTLINE_FOR_SHAPE = {
+    "ibeam": "ibeam", "wait": "wait", "progress": "wait", "crosshair": "cross", "size_all": "cross",
+    "size_we": "cross", "size_ns": "cross", "size_nwse": "cross", "size_nesw": "cross",
+}
+
 class RemoteControllerClient:
-    def __init__(self):
+    def __init__(self, session_id="default", view_only=False):
         self.websocket = None
+        self.session_id = session_id
+        # Режим наблюдателя: только просмотр экрана, без управления
+        self.view_only = view_only
         self.client_id = f"controller_{datetime.now().strftime('%H%M%S')}"
         self.connected = False
         self.screen_window = None
@@ -31,26 +55,45 @@ class RemoteControllerClient:
             'offset_y': 0,
             'scaled_width': 1920,
             'scaled_height': 1080,
-            'scale_ratio': 1.0
+            'scale_ratio': 1.0,
+            'origin_x': 0,
+            'origin_y': 0
         }
+        # Параметры масштабирования по эпохам геометрии управляемого клиента
+        self.frame_geometries = {}
+        
+        # Текущее изображение экрана: полный кадр, поверх которого накладываются дельты
+        self.screen_image = None
+        self.screen_photo = None
+        self.screen_image_item = None
+        self.keyframe_requested_at = 0
+        
+        # Выбор области экрана (set_viewport): режим выбора и начальная точка рамки
+        self.selecting_viewport = False
+        self.viewport_start = None
+        self.viewport_rect_item = None
+        # Мониторы управляемого клиента из controlled_connected
+        self.monitors = []
+        
+        # Указатель управляемого компьютера поверх экрана: последнее положение и элемент canvas
+        self.remote_cursor = None
+        self.cursor_item = None
+        self.cursor_outline = None
+        
+        # Прореживание записей о кадрах в журнале окна
+        self.frame_log_sampler = EventSampler(sample_interval())
         
         self.setup_logging()
         
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler("controller.log", encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(log_file="controller.log")
         self.logger = logging.getLogger("RemoteController")
 
     def create_control_window(self):
         """Создание окна управления"""
         self.control_window = tk.Tk()
-        self.control_window.title(f"Удаленное управление - {self.client_id}")
+        title_mode = "Наблюдение" if self.view_only else "Удаленное управление"
+        self.control_window.title(f"{title_mode} - {self.client_id} (сессия {self.session_id})")
         self.control_window.geometry("500x400")
         self.control_window.protocol("WM_DELETE_WINDOW", self.quit_app)
         
@@ -102,6 +145,26 @@ class RemoteControllerClient:
         tk.Button(button_frame, text="🔴 Выход", command=self.quit_app,
                  width=10, height=2, bg="red", fg="white").pack(side=tk.LEFT, padx=5)
         
+        # Область экрана: передается только выбранный прямоугольник в родном разрешении
+        viewport_frame = tk.Frame(self.control_window)
+        viewport_frame.pack(pady=5)
+        
+        self.viewport_btn = tk.Button(viewport_frame, text="🔍 Выбрать область",
+                                     command=self.start_viewport_selection, state=tk.DISABLED,
+                                     width=15)
+        self.viewport_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.full_screen_btn = tk.Button(viewport_frame, text="🖥️ Весь экран",
+                                        command=self.reset_viewport, state=tk.DISABLED,
+                                        width=15)
+        self.full_screen_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Выбор монитора на компьютере с несколькими дисплеями
+        self.monitor_var = tk.StringVar(value=ALL_MONITORS_LABEL)
+        self.monitor_menu = tk.OptionMenu(viewport_frame, self.monitor_var, ALL_MONITORS_LABEL)
+        self.monitor_menu.config(state=tk.DISABLED, width=18)
+        self.monitor_menu.pack(side=tk.LEFT, padx=5)
+        
         # Окно для отображения экрана
         self.screen_window = tk.Toplevel(self.control_window)
         self.screen_window.title("Экран удаленного компьютера - Режим: Весь экран")
@@ -129,6 +192,7 @@ class RemoteControllerClient:
         self.screen_canvas.bind("<Motion>", self.on_mouse_move)
         self.screen_canvas.bind("<ButtonPress-1>", self.on_mouse_down)
         self.screen_canvas.bind("<ButtonRelease-1>", self.on_mouse_up)
+        self.screen_canvas.bind("<B1-Motion>", self.on_mouse_drag)
         self.screen_canvas.bind("<ButtonPress-3>", self.on_right_mouse_down)
         self.screen_canvas.bind("<ButtonRelease-3>", self.on_right_mouse_up)
         self.screen_canvas.bind("<Double-Button-1>", self.on_double_click)
@@ -147,7 +211,7 @@ class RemoteControllerClient:
     def on_mouse_move(self, event):
         """Обработка движения мыши"""
         current_time = time.time()
-        if (self.mouse_control_enabled and self.connected and 
+        if (self.mouse_control_enabled and self.connected and not self.selecting_viewport and
             (current_time - self.last_mouse_time) >= self.mouse_throttle):
             
             self.last_mouse_time = current_time
@@ -162,7 +226,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -172,6 +238,9 @@ class RemoteControllerClient:
 
     def on_mouse_down(self, event):
         """Левый клик мыши - нажатие"""
+        if self.selecting_viewport:
+            self.begin_viewport_rect(event)
+            return
         if self.mouse_control_enabled and self.connected:
             if self.is_point_in_image(event.x, event.y):
                 mouse_data = {
@@ -182,7 +251,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -192,6 +263,9 @@ class RemoteControllerClient:
 
     def on_mouse_up(self, event):
         """Левый клик мыши - отпускание"""
+        if self.selecting_viewport:
+            self.finish_viewport_rect(event)
+            return
         if self.mouse_control_enabled and self.connected:
             if self.is_point_in_image(event.x, event.y):
                 mouse_data = {
@@ -202,7 +276,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -210,6 +286,15 @@ class RemoteControllerClient:
                     self.asyncio_loop
                 )
 
+    def on_mouse_drag(self, event):
+        """Движение с нажатой левой кнопкой: рамка выбора области или обычное движение мыши"""
+        if not self.selecting_viewport:
+            self.on_mouse_move(event)
+            return
+        if self.viewport_start and self.viewport_rect_item:
+            x, y = self.viewport_start
+            self.screen_canvas.coords(self.viewport_rect_item, x, y, event.x, event.y)
+
     def on_right_mouse_down(self, event):
         """Правый клик мыши - нажатие"""
         if self.mouse_control_enabled and self.connected:
@@ -222,7 +307,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -242,7 +329,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -262,7 +351,9 @@ class RemoteControllerClient:
                     "offset_x": self.scale_params['offset_x'],
                     "offset_y": self.scale_params['offset_y'],
                     "scaled_width": self.scale_params['scaled_width'],
-                    "scaled_height": self.scale_params['scaled_height']
+                    "scaled_height": self.scale_params['scaled_height'],
+                    "origin_x": self.scale_params['origin_x'],
+                    "origin_y": self.scale_params['origin_y']
                 }
                 
                 asyncio.run_coroutine_threadsafe(
@@ -307,18 +398,33 @@ class RemoteControllerClient:
             pass
         finally:
             if self.control_window:
-                self.control_window.after(50, self.process_messages)
+                # Указатель приходит до 60 раз в секунду, очередь разбирается с той же частотой
+                self.control_window.after(16, self.process_messages)
 
     def handle_async_message(self, message):
         """Обработка сообщений из асинхронного потока"""
         msg_type = message.get("type")
         
         if msg_type == "screen_update":
-            self.log_info("📸 Получены данные ВСЕГО экрана")
+            # Журнал в окне пополняется не на каждый кадр: вставка в Text стоит времени GUI
+            suppressed = self.frame_log_sampler.allow("screen_update")
+            if suppressed is not None:
+                self.log_info("📸 Получены данные ВСЕГО экрана" + (f" (+{suppressed} кадров)" if suppressed else ""))
             self.display_screen(message)
             
+        elif msg_type == "screen_delta":
+            self.apply_screen_delta(message)
+            
+        elif msg_type == "screen_geometry":
+            self.store_geometry(message)
+            
+        elif msg_type == "cursor":
+            self.remote_cursor = message
+            self.draw_cursor()
+            
         elif msg_type == "controlled_connected":
             self.log_info("🖥️ Управляемый клиент подключен")
+            self.update_monitors(message.get("monitors") or [])
             
         elif msg_type == "controlled_disconnected":
             self.log_info("🔌 Управляемый клиент отключен")
@@ -334,53 +440,231 @@ class RemoteControllerClient:
         elif msg_type == "error":
             self.log_info(f"❌ Ошибка: {message.get('message', '')}")
 
+    def store_geometry(self, message):
+        """Сохранение параметров масштабирования из screen_geometry под номером эпохи"""
+        self.frame_geometries[message.get("epoch")] = {
+            'offset_x': message.get('offset_x', 0),
+            'offset_y': message.get('offset_y', 0),
+            'scaled_width': message.get('scaled_width', 1920),
+            'scaled_height': message.get('scaled_height', 1080),
+            'scale_ratio': message.get('scale_ratio', 1.0),
+            'origin_x': message.get('origin_x') or 0,
+            'origin_y': message.get('origin_y') or 0
+        }
+        # Кадры старых эпох могут еще быть в пути, но хранить больше нескольких незачем
+        while len(self.frame_geometries) > 4:
+            del self.frame_geometries[next(iter(self.frame_geometries))]
+
+    def update_scale_params(self, message):
+        """Переход на параметры масштабирования эпохи, к которой относится кадр"""
+        geometry = self.frame_geometries.get(message.get("geometry_epoch"))
+        if geometry is None or geometry is self.scale_params:
+            return
+        self.scale_params = geometry
+        
+        self.logger.info(f"🖼️ Параметры масштабирования: {self.scale_params}")
+
+    def show_screen_image(self):
+        """Вывод текущего изображения на canvas; PhotoImage и элемент canvas переиспользуются"""
+        photo = self.screen_photo
+        if photo is None or (photo.width(), photo.height()) != self.screen_image.size:
+            photo = ImageTk.PhotoImage(self.screen_image)
+            self.screen_canvas.delete("all")
+            self.cursor_item = None
+            self.screen_image_item = self.screen_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
+            self.screen_canvas.image = photo  # Сохраняем ссылку
+            self.screen_photo = photo
+            self.draw_cursor()
+        else:
+            photo.paste(self.screen_image)
+        
+        # Показываем окно, если оно скрыто
+        if not self.screen_window.winfo_viewable():
+            self.screen_window.deiconify()
+
+    def draw_cursor(self):
+        """Указатель управляемого компьютера поверх кадра в координатах текущей геометрии"""
+        cursor = self.remote_cursor
+        if cursor is None or self.screen_image_item is None:
+            return
+        params = self.scale_params
+        x = params['offset_x'] + (cursor["x"] - params['origin_x']) * params['scale_ratio']
+        y = params['offset_y'] + (cursor["y"] - params['origin_y']) * params['scale_ratio']
+        shape = CURSOR_SHAPES[cursor["shape"]] if cursor["shape"] < len(CURSOR_SHAPES) else "arrow"
+        outline = CURSOR_OUTLINE_FOR_SHAPE.get(shape, "arrow")
+        visible = cursor["visible"] and self.is_point_in_image(x, y)
+        
+        if self.cursor_item is None or outline != self.cursor_outline:
+            if self.cursor_item is not None:
+                self.screen_canvas.delete(self.cursor_item)
+            points = [coordinate for point in CURSOR_OUTLINES[outline] for coordinate in point]
+            if outline == "arrow":
+                self.cursor_item = self.screen_canvas.create_polygon(points, fill="white", outline="black")
+            else:
+                self.cursor_item = self.screen_canvas.create_line(points, fill="black", width=2)
+            self.cursor_outline = outline
+        points = [coordinate for dx, dy in CURSOR_OUTLINES[outline] for coordinate in (x + dx, y + dy)]
+        self.screen_canvas.coords(self.cursor_item, *points)
+        self.screen_canvas.itemconfigure(self.cursor_item, state=tk.NORMAL if visible else tk.HIDDEN)
+        self.screen_canvas.tag_raise(self.cursor_item)
+
     def display_screen(self, message):
-        """Отображение скриншота с информацией о масштабировании"""
+        """Отображение полного кадра с информацией о масштабировании"""
         try:
-            screen_data = message.get("screen_data")
-            if not screen_data:
+            image_data = message.get("image")
+            if not image_data:
                 self.logger.error("❌ Пустые данные экрана")
                 return
                 
             # Сохраняем параметры масштабирования
-            self.scale_params = {
-                'offset_x': message.get('offset_x', 0),
-                'offset_y': message.get('offset_y', 0),
-                'scaled_width': message.get('scaled_width', 1920),
-                'scaled_height': message.get('scaled_height', 1080),
-                'scale_ratio': message.get('scale_ratio', 1.0)
-            }
-            
-            self.logger.info(f"🖼️ Параметры масштабирования: {self.scale_params}")
-            
-            # Декодируем base64
-            image_data = base64.b64decode(screen_data)
-            
-            # Создаем BytesIO объект
-            image_buffer = io.BytesIO(image_data)
+            self.update_scale_params(message)
             
             # Открываем изображение
-            image = Image.open(image_buffer)
-            
-            # Создаем PhotoImage
-            photo = ImageTk.PhotoImage(image)
-            
-            # Очищаем canvas и отображаем изображение
-            self.screen_canvas.delete("all")
-            self.screen_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
-            self.screen_canvas.image = photo  # Сохраняем ссылку
-            
-            # Показываем окно, если оно скрыто
-            if not self.screen_window.winfo_viewable():
-                self.screen_window.deiconify()
+            image = Image.open(io.BytesIO(image_data), formats=[message["format"]])
+            image.load()
+            self.screen_image = image.convert('RGB')
+            self.show_screen_image()
+            self.acknowledge_frame(message["frame_id"])
                     
-            self.logger.info("✅ Весь экран отображен корректно")
+            self.logger.info("✅ Весь экран отображен корректно", extra={"event": "frame_displayed"})
                 
         except Exception as e:
             self.logger.error(f"❌ Ошибка отображения экрана: {e}")
             import traceback
             self.logger.error(f"🔍 Подробности: {traceback.format_exc()}")
 
+    def apply_screen_delta(self, message):
+        """Наложение изменившихся плиток на текущее изображение экрана"""
+        try:
+            if self.screen_image is None:
+                # Дельта без полного кадра неприменима
+                self.request_keyframe()
+                return
+            
+            self.update_scale_params(message)
+            formats = [message["format"]]
+            for x, y, tile_data in message.get("tiles") or []:
+                # Плитки с палитрой (PNG) paste приводит к RGB сам
+                self.screen_image.paste(Image.open(io.BytesIO(tile_data), formats=formats), (x, y))
+            self.show_screen_image()
+            self.acknowledge_frame(message["frame_id"])
+            
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка наложения дельта-кадра: {e}")
+            self.request_keyframe()
+
+    def acknowledge_frame(self, frame_id):
+        """Подтверждение показа кадра: управляемый клиент не отправляет новые, пока не показаны старые
+
+        Наблюдатели кадры не подтверждают: окно держится по управляющему.
+        """
+        if not self.connected or self.view_only:
+            return
+        asyncio.run_coroutine_threadsafe(
+            self.send_frame_ack(frame_id),
+            self.asyncio_loop
+        )
+
+    def start_viewport_selection(self):
+        """Режим выбора области: следующая рамка левой кнопкой задает область экрана"""
+        if not self.connected or self.view_only:
+            return
+        self.selecting_viewport = True
+        self.viewport_start = None
+        if not self.screen_window.winfo_viewable():
+            self.screen_window.deiconify()
+        self.log_info("🔍 Выделите область на экране левой кнопкой мыши")
+
+    def begin_viewport_rect(self, event):
+        self.viewport_start = (event.x, event.y)
+        self.viewport_rect_item = self.screen_canvas.create_rectangle(
+            event.x, event.y, event.x, event.y, outline="yellow", dash=(4, 2)
+        )
+
+    def finish_viewport_rect(self, event):
+        """Рамка в координатах кадра пересчитывается в пиксели экрана управляемого компьютера"""
+        self.selecting_viewport = False
+        if self.viewport_rect_item:
+            self.screen_canvas.delete(self.viewport_rect_item)
+            self.viewport_rect_item = None
+        if not self.viewport_start:
+            return
+        params = self.scale_params
+        left_edge, top_edge = params['offset_x'], params['offset_y']
+        right_edge, bottom_edge = left_edge + params['scaled_width'], top_edge + params['scaled_height']
+        (start_x, start_y), self.viewport_start = self.viewport_start, None
+        left = max(min(start_x, event.x), left_edge)
+        top = max(min(start_y, event.y), top_edge)
+        right = min(max(start_x, event.x), right_edge)
+        bottom = min(max(start_y, event.y), bottom_edge)
+        if right - left < 8 or bottom - top < 8:
+            self.log_info("⚠️ Слишком маленькая область")
+            return
+        
+        ratio = params['scale_ratio']
+        viewport = {
+            "x": params['origin_x'] + int((left - left_edge) / ratio),
+            "y": params['origin_y'] + int((top - top_edge) / ratio),
+            "width": int((right - left) / ratio),
+            "height": int((bottom - top) / ratio)
+        }
+        asyncio.run_coroutine_threadsafe(
+            self.send_command("set_viewport", viewport),
+            self.asyncio_loop
+        )
+        self.log_info(f"🔍 Запрошена область {viewport['width']}x{viewport['height']} с ({viewport['x']}, {viewport['y']})")
+
+    def monitor_label(self, monitor):
+        primary = ", основной" if monitor.get("primary") else ""
+        return f"{monitor['index']}: {monitor['width']}x{monitor['height']}{primary}"
+
+    def update_monitors(self, monitors):
+        """Список мониторов управляемого клиента в меню выбора"""
+        self.monitors = monitors
+        menu = self.monitor_menu["menu"]
+        menu.delete(0, tk.END)
+        for label in [ALL_MONITORS_LABEL] + [self.monitor_label(monitor) for monitor in monitors]:
+            menu.add_command(label=label, command=tk._setit(self.monitor_var, label, self.select_monitor))
+        self.monitor_var.set(ALL_MONITORS_LABEL)
+        if len(monitors) > 1:
+            self.log_info(f"🖵 Мониторов на управляемом компьютере: {len(monitors)}")
+
+    def select_monitor(self, label):
+        """Захват только выбранного монитора (select_monitor)"""
+        if not self.connected or self.view_only:
+            return
+        index = None
+        for monitor in self.monitors:
+            if self.monitor_label(monitor) == label:
+                index = monitor["index"]
+        asyncio.run_coroutine_threadsafe(
+            self.send_command("select_monitor", None if index is None else {"index": index}),
+            self.asyncio_loop
+        )
+        self.log_info(f"🖵 Запрошен монитор: {label}")
+
+    def reset_viewport(self):
+        """Возврат к передаче всего экрана"""
+        if not self.connected or self.view_only:
+            return
+        self.selecting_viewport = False
+        asyncio.run_coroutine_threadsafe(
+            self.send_command("set_viewport", None),
+            self.asyncio_loop
+        )
+        self.log_info("🖥️ Запрошен весь экран")
+
+    def request_keyframe(self):
+        """Запрос полного кадра, не чаще раза в секунду"""
+        now = time.time()
+        if not self.connected or now - self.keyframe_requested_at < 1.0:
+            return
+        self.keyframe_requested_at = now
+        asyncio.run_coroutine_threadsafe(
+            self.send_command("request_keyframe"),
+            self.asyncio_loop
+        )
+
     def update_status(self, message, is_connected=False):
         """Обновление статуса подключения"""
         self.connected = is_connected
@@ -390,7 +674,10 @@ class RemoteControllerClient:
         
         self.screen_btn.config(state=tk.NORMAL if is_connected else tk.DISABLED)
         self.stop_screen_btn.config(state=tk.NORMAL if is_connected else tk.DISABLED)
-        self.mouse_btn.config(state=tk.NORMAL if is_connected else tk.DISABLED)
+        self.mouse_btn.config(state=tk.NORMAL if is_connected and not self.view_only else tk.DISABLED)
+        self.viewport_btn.config(state=tk.NORMAL if is_connected and not self.view_only else tk.DISABLED)
+        self.full_screen_btn.config(state=tk.NORMAL if is_connected and not self.view_only else tk.DISABLED)
+        self.monitor_menu.config(state=tk.NORMAL if is_connected and not self.view_only else tk.DISABLED)
         
         self.log_info(message)
 
@@ -412,13 +699,18 @@ class RemoteControllerClient:
 
     def stop_screen(self):
         """Остановка передачи экрана"""
-        if self.connected:
+        if self.connected and not self.view_only:
             asyncio.run_coroutine_threadsafe(
                 self.send_command("stop_capture"), 
                 self.asyncio_loop
             )
             self.log_info("⏹️ Остановка передачи экрана")
             self.screen_canvas.delete("all")
+            self.screen_image = None
+            self.screen_photo = None
+            self.screen_image_item = None
+            self.cursor_item = None
+            self.remote_cursor = None
             self.screen_window.withdraw()
 
     def toggle_mouse_control(self):
@@ -445,20 +737,23 @@ class RemoteControllerClient:
 
     def disable_mouse_control(self):
         """Выключение управления мышью"""
+        was_enabled = self.mouse_control_enabled
         self.mouse_control_enabled = False
         self.mouse_btn.config(text="🐭 Включить управление", bg="SystemButtonFace", fg="black")
         self.log_info("🖱️ Управление мышью деактивировано")
         
-        asyncio.run_coroutine_threadsafe(
-            self.send_command("toggle_mouse_control"), 
-            self.asyncio_loop
-        )
+        # Переключаем на стороне управляемого только реально включенное управление
+        if was_enabled:
+            asyncio.run_coroutine_threadsafe(
+                self.send_command("toggle_mouse_control"), 
+                self.asyncio_loop
+            )
 
     async def send_command(self, command, data=None):
         """Отправка команды управляемому клиенту"""
         if self.websocket and self.connected:
             try:
-                await self.websocket.send(json.dumps({
+                await self.websocket.send(codec.dumps({
                     "type": "control_command",
                     "command": command,
                     "data": data
@@ -467,6 +762,13 @@ class RemoteControllerClient:
             except Exception as e:
                 self.logger.error(f"❌ Ошибка отправки команды: {e}")
 
+    async def send_frame_ack(self, frame_id):
+        if self.websocket and self.connected:
+            try:
+                await self.websocket.send(codec.dumps({"type": "frame_ack", "frame_id": frame_id}))
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка отправки подтверждения кадра: {e}")
+
     async def connect_to_server(self, uri):
         try:
             self.logger.info(f"🔄 Подключение к {uri}...")
@@ -475,16 +777,18 @@ class RemoteControllerClient:
                 ping_interval=30,
                 ping_timeout=10,
                 close_timeout=5,
-                max_size=10 * 1024 * 1024
+                max_size=10 * 1024 * 1024,
+                **client_compression_options()
             )
             
-            await self.websocket.send(json.dumps({
-                "type": "controller",
-                "client_id": self.client_id
+            await self.websocket.send(codec.dumps({
+                "type": "viewer" if self.view_only else "controller",
+                "client_id": self.client_id,
+                "session_id": self.session_id
             }))
             
             message = await self.websocket.recv()
-            data = json.loads(message)
+            data = codec.loads(message)
             
             if data.get("type") == "connection_established":
                 self.message_queue.put({
@@ -503,10 +807,40 @@ class RemoteControllerClient:
             })
             return False
 
+    def decode_frame_message(self, message):
+        """Двоичный кадр экрана в сообщение для потока GUI; изображения не копируются"""
+        header = decode_header(message)
+        if header.kind == FRAME_KEY:
+            data = {"type": "screen_update", "image": frame_payload(message)}
+        else:
+            data = {"type": "screen_delta", "tiles": decode_tiles(header, message)}
+        data["frame_id"] = header.frame_id
+        data["format"] = CODEC_FORMATS[header.codec]
+        data["geometry_epoch"] = header.geometry_epoch
+        data["timestamp"] = header.timestamp
+        return data
+
     async def receive_messages(self):
         try:
             async for message in self.websocket:
-                data = json.loads(message)
+                if isinstance(message, bytes):
+                    try:
+                        if is_cursor_message(message):
+                            cursor = decode_cursor(message)
+                            data = {
+                                "type": "cursor",
+                                "x": cursor.x,
+                                "y": cursor.y,
+                                "shape": cursor.shape,
+                                "visible": bool(cursor.flags & CURSOR_VISIBLE)
+                            }
+                        else:
+                            data = self.decode_frame_message(message)
+                    except ValueError as e:
+                        self.logger.error(f"❌ Некорректный кадр экрана: {e}")
+                        continue
+                else:
+                    data = codec.loads(message)
                 self.message_queue.put(data)
                     
         except websockets.exceptions.ConnectionClosed:
@@ -527,6 +861,7 @@ class RemoteControllerClient:
     async def async_main(self, uri):
         """Асинхронная основная функция"""
         self.asyncio_loop = asyncio.get_running_loop()
+        self.logger.info(f"⚙️ {codec.describe()}")
         
         if not await self.connect_to_server(uri):
             return
@@ -536,7 +871,7 @@ class RemoteControllerClient:
     def start_async_thread(self, uri):
         """Запуск асинхронного кода в отдельном потоке"""
         def run_async():
-            asyncio.run(self.async_main(uri))
+            codec.run(self.async_main(uri))
         
         self.asyncio_thread = threading.Thread(target=run_async, daemon=True)
         self.asyncio_thread.start()
@@ -572,7 +907,7 @@ def main():
     print("🖥️  Режим: Отображение ВСЕГО экрана управляемого компьютера")
     print("💡 Все элементы интерфейса будут видны")
     
-    logging.basicConfig(level=logging.INFO)
+    setup_logging(log_file="controller.log")
     logger = logging.getLogger("Main")
     
     try:
@@ -589,7 +924,17 @@ def main():
             uri = f"wss://{domain}"
             logger.info(f"🌐 Удаленное подключение: {uri}")
 
-        client = RemoteControllerClient()
+        # Идентификатор сессии: второй аргумент или переменная окружения
+        session_id = sys.argv[2] if len(sys.argv) > 2 else os.environ.get('REMOTE_SESSION_ID', 'default')
+        logger.info(f"🔑 Сессия: {session_id}")
+
+        # Третий аргумент 'view' или REMOTE_ROLE=viewer - режим наблюдателя
+        role = sys.argv[3] if len(sys.argv) > 3 else os.environ.get('REMOTE_ROLE', 'controller')
+        view_only = role.lower() in ('view', 'viewer')
+        if view_only:
+            logger.info("👁️ Режим наблюдателя: только просмотр экрана")
+
+        client = RemoteControllerClient(session_id=session_id, view_only=view_only)
         client.start(uri)
         
     except KeyboardInterrupt:
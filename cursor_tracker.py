@@ -0,0 +1,80 @@
+import ctypes
+import sys
+from frame_protocol import CURSOR_SHAPES
+
+# Положение и форма указателя мыши управляемого компьютера для канала указателя.
+# Источники по порядку: источник захвата (синтетический рисует свой указатель),
+# WinAPI GetCursorInfo (положение, форма и видимость), pyautogui.position (только положение).
+
+ARROW = CURSOR_SHAPES.index("arrow")
+
+def win32_reader():
+    from ctypes import wintypes
+
+    class CURSORINFO(ctypes.Structure):
+        _fields_ = [
+            ("cbSize", wintypes.DWORD),
+            ("flags", wintypes.DWORD),
+            ("hCursor", wintypes.HANDLE),
+            ("ptScreenPos", wintypes.POINT),
+        ]
+
+    CURSOR_SHOWING = 1
+    # Стандартные указатели Windows (IDC_*) и их формы
+    system_cursors = {
+        32512: "arrow", 32513: "ibeam", 32514: "wait", 32515: "crosshair", 32649: "hand",
+        32646: "size_all", 32644: "size_we", 32645: "size_ns", 32642: "size_nwse",
+        32643: "size_nesw", 32648: "no", 32650: "progress",
+    }
+    user32 = ctypes.windll.user32
+    user32.LoadCursorW.restype = wintypes.HANDLE
+    user32.LoadCursorW.argtypes = [wintypes.HINSTANCE, wintypes.LPVOID]
+    # Дескрипторы стандартных указателей общие для всех процессов
+    shapes = {
+        user32.LoadCursorW(None, cursor_id): CURSOR_SHAPES.index(shape)
+        for cursor_id, shape in system_cursors.items()
+    }
+    info = CURSORINFO()
+    info.cbSize = ctypes.sizeof(CURSORINFO)
+
+    def read():
+        if not user32.GetCursorInfo(ctypes.byref(info)):
+            return None
+        visible = bool(info.flags & CURSOR_SHOWING)
+        return info.ptScreenPos.x, info.ptScreenPos.y, shapes.get(info.hCursor, ARROW), visible
+
+    return read
+
+def pyautogui_reader():
+    import pyautogui
+
+    def read():
+        x, y = pyautogui.position()
+        return x, y, ARROW, True
+
+    return read
+
+class CursorTracker:
+    """Чтение указателя: read() возвращает (x, y, форма, видимость) или None"""
+    def __init__(self, source=None):
+        self.reader = None
+        self.name = None
+        readers = []
+        if source is not None and source.cursor() is not None:
+            readers.append(("source", lambda: source.cursor))
+        if sys.platform == 'win32':
+            readers.append(("win32", win32_reader))
+        readers.append(("pyautogui", pyautogui_reader))
+        for name, factory in readers:
+            try:
+                self.reader = factory()
+            except Exception:
+                continue
+            self.name = name
+            break
+
+    def available(self):
+        return self.reader is not None
+
+    def read(self):
+        return self.reader() if self.reader else None
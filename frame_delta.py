@@ -0,0 +1,97 @@
+import os
+import threading
+import numpy as np
+
+# Разностное кодирование кадров экрана по сетке плиток.
+# SCREEN_DELTA=0 отключает дельты (только полные кадры), DELTA_TILE_SIZE - размер плитки,
+# DELTA_KEYFRAME_INTERVAL - через сколько дельт отправлять полный опорный кадр,
+# DELTA_MAX_RATIO - при большей доле изменившихся плиток дешевле полный кадр.
+
+DEFAULT_TILE_SIZE = 64
+DEFAULT_KEYFRAME_INTERVAL = 100
+DEFAULT_MAX_DELTA_RATIO = 0.5
+
+def delta_enabled():
+    return os.environ.get('SCREEN_DELTA', '1') == '1'
+
+def frame_pixels(image):
+    """Пиксели RGB-кадра как массив uint32 строки x столбцы: одно сравнение на пиксель"""
+    width, height = image.size
+    return np.frombuffer(image.tobytes('raw', 'RGBX'), dtype=np.uint32).reshape(height, width)
+
+class TileDiffer:
+    """Поиск изменившихся областей кадра относительно предыдущего
+
+    Кадры сравниваются целиком векторно в NumPy, затем маска сворачивается
+    до сетки плиток. Соседние изменившиеся плитки одной строки объединяются
+    в один прямоугольник, чтобы не кодировать много мелких изображений.
+    """
+    def __init__(self, tile_size=None, keyframe_interval=None, max_delta_ratio=None):
+        self.tile_size = tile_size or int(os.environ.get('DELTA_TILE_SIZE', DEFAULT_TILE_SIZE))
+        self.keyframe_interval = keyframe_interval or int(
+            os.environ.get('DELTA_KEYFRAME_INTERVAL', DEFAULT_KEYFRAME_INTERVAL)
+        )
+        self.max_delta_ratio = max_delta_ratio or float(os.environ.get('DELTA_MAX_RATIO', DEFAULT_MAX_DELTA_RATIO))
+        self.previous = None
+        self.frames_since_keyframe = 0
+        # Запрос ставится из цикла событий, а забирается потоком кодирования: под блокировкой
+        self.keyframe_requested = False
+        self.request_lock = threading.Lock()
+        # Изменился ли последний кадр; периодический опорный кадр изменением не считается
+        self.changed = True
+
+    def request_keyframe(self):
+        """Следующий кадр будет полным (например, подключился новый зритель)"""
+        with self.request_lock:
+            self.keyframe_requested = True
+
+    def changed_tiles(self, current):
+        """Маска изменившихся плиток: строки x столбцы сетки"""
+        height, width = current.shape
+        tile = self.tile_size
+        changed = current != self.previous
+        step = tile
+        if width % 8 == 0 and tile % 8 == 0:
+            # 8 пикселей на элемент uint64: свертка по столбцам в 8 раз короче
+            changed = changed.view(np.uint64)
+            step = tile // 8
+        # reduceat сам обрабатывает неполные плитки у правого и нижнего края
+        columns = np.bitwise_or.reduceat(changed, np.arange(0, changed.shape[1], step), axis=1)
+        return np.bitwise_or.reduceat(columns, np.arange(0, height, tile), axis=0) != 0
+
+    def tile_rects(self, mask, width, height):
+        """Прямоугольники (x, y, w, h) из маски плиток с объединением соседних по строке"""
+        tile = self.tile_size
+        rects = []
+        for row in np.flatnonzero(mask.any(axis=1)):
+            edges = np.flatnonzero(np.diff(np.concatenate(([False], mask[row], [False])).astype(np.int8)))
+            y = int(row) * tile
+            tile_height = min(tile, height - y)
+            for start, end in zip(edges[::2], edges[1::2]):
+                x = int(start) * tile
+                rects.append((x, y, min(int(end) * tile, width) - x, tile_height))
+        return rects
+
+    def diff(self, image):
+        """Изменившиеся области кадра; None - нужен полный кадр, пустой список - кадр не изменился"""
+        current = frame_pixels(image)
+        with self.request_lock:
+            requested, self.keyframe_requested = self.keyframe_requested, False
+        mask = None
+        if self.previous is not None and self.previous.shape == current.shape:
+            mask = self.changed_tiles(current)
+        self.changed = mask is None or bool(mask.any())
+        keyframe = (
+            requested
+            or mask is None
+            or self.frames_since_keyframe >= self.keyframe_interval
+            or mask.mean() > self.max_delta_ratio
+        )
+        self.previous = current
+
+        if keyframe:
+            self.frames_since_keyframe = 0
+            return None
+        self.frames_since_keyframe += 1
+        height, width = current.shape
+        return self.tile_rects(mask, width, height)
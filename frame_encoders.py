@@ -0,0 +1,111 @@
+import io
+import os
+from PIL import Image
+from frame_protocol import CODEC_JPEG, CODEC_PNG, CODEC_WEBP
+
+# Кодировщики изображений кадров экрана.
+# FRAME_ENCODER - имя предустановки из ENCODER_PRESETS, FRAME_QUALITY - качество
+# (для JPEG и WebP с потерями), JPEG_SUBSAMPLING=4:4:4|4:2:2|4:2:0, JPEG_OPTIMIZE=0|1.
+# Номер формата (codec) пишется в заголовок кадра, управляющий выбирает декодер по нему.
+
+DEFAULT_ENCODER = "jpeg"
+
+class FrameEncoder:
+    """Кодировщик кадра: изображение Pillow в байты формата codec"""
+    codec = None
+    name = None
+
+    def encode(self, image):
+        buffer = io.BytesIO()
+        self.save(image, buffer)
+        return buffer.getvalue()
+
+    def save(self, image, buffer):
+        raise NotImplementedError
+
+    def describe(self):
+        return self.name
+
+class JpegEncoder(FrameEncoder):
+    """JPEG: быстрый и универсальный вариант для фото и видео на экране"""
+    codec = CODEC_JPEG
+    name = "jpeg"
+
+    def __init__(self, quality=85, subsampling="4:2:0", optimize=True):
+        self.quality = quality
+        self.subsampling = subsampling
+        # optimize ужимает таблицы Хаффмана на несколько процентов ценой лишнего прохода
+        self.optimize = optimize
+
+    def save(self, image, buffer):
+        image.save(buffer, format='JPEG', quality=self.quality, subsampling=self.subsampling, optimize=self.optimize)
+
+    def describe(self):
+        optimize = ", optimize" if self.optimize else ""
+        return f"jpeg q{self.quality} {self.subsampling}{optimize}"
+
+class WebpEncoder(FrameEncoder):
+    """WebP: с потерями меньше JPEG при том же качестве, без потерь - для текста"""
+    codec = CODEC_WEBP
+    name = "webp"
+
+    def __init__(self, quality=80, lossless=False, method=2):
+        # Для lossless quality задает усилие сжатия, а не качество
+        self.quality = quality
+        self.lossless = lossless
+        # 0 - быстрее всего, 6 - лучше всего сжимает
+        self.method = method
+
+    def save(self, image, buffer):
+        image.save(buffer, format='WEBP', quality=self.quality, lossless=self.lossless, method=self.method)
+
+    def describe(self):
+        mode = "lossless" if self.lossless else f"q{self.quality}"
+        return f"webp {mode} m{self.method}"
+
+class PngEncoder(FrameEncoder):
+    """PNG без потерь; с палитрой - для экранов с текстом и интерфейсом, где мало цветов"""
+    codec = CODEC_PNG
+    name = "png"
+
+    def __init__(self, palette=False, colors=256, compress_level=1):
+        self.palette = palette
+        self.colors = colors
+        self.compress_level = compress_level
+
+    def save(self, image, buffer):
+        if self.palette:
+            # FASTOCTREE в разы быстрее MEDIANCUT; без дизеринга текст остается четким
+            image = image.quantize(self.colors, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        image.save(buffer, format='PNG', compress_level=self.compress_level)
+
+    def describe(self):
+        palette = f" palette{self.colors}" if self.palette else ""
+        return f"png{palette} z{self.compress_level}"
+
+# Предустановки: класс и параметры по умолчанию
+ENCODER_PRESETS = {
+    "jpeg": (JpegEncoder, {}),
+    "jpeg-fast": (JpegEncoder, {"quality": 70, "optimize": False}),
+    "jpeg-sharp": (JpegEncoder, {"quality": 90, "subsampling": "4:4:4", "optimize": False}),
+    "webp": (WebpEncoder, {}),
+    "webp-lossless": (WebpEncoder, {"lossless": True, "quality": 10, "method": 0}),
+    "png": (PngEncoder, {}),
+    "png-palette": (PngEncoder, {"palette": True}),
+}
+
+def create_encoder(preset=None):
+    """Кодировщик по предустановке с поправками из переменных окружения"""
+    preset = preset or os.environ.get('FRAME_ENCODER', DEFAULT_ENCODER)
+    if preset not in ENCODER_PRESETS:
+        raise ValueError(f"Неизвестный кодировщик кадров: {preset}")
+    encoder_class, options = ENCODER_PRESETS[preset]
+    options = dict(options)
+    if 'FRAME_QUALITY' in os.environ and encoder_class is not PngEncoder:
+        options["quality"] = int(os.environ['FRAME_QUALITY'])
+    if encoder_class is JpegEncoder:
+        if 'JPEG_SUBSAMPLING' in os.environ:
+            options["subsampling"] = os.environ['JPEG_SUBSAMPLING']
+        if 'JPEG_OPTIMIZE' in os.environ:
+            options["optimize"] = os.environ['JPEG_OPTIMIZE'] == '1'
+    return encoder_class(**options)
@@ -0,0 +1,141 @@
+import struct
+import zlib
+from collections import namedtuple
+
+# Двоичный формат кадров экрана (кадры идут двоичными сообщениями WebSocket,
+# служебные сообщения остаются JSON). Заголовок фиксированной длины, затем
+# данные изображения без base64:
+#   опорный кадр - байты изображения целиком;
+#   дельта - таблица плиток (x, y, длина) и подряд байты плиток.
+# Параметры масштабирования в кадр не входят: они отправляются JSON-сообщением
+# screen_geometry только при изменении, а кадр ссылается на них номером эпохи.
+
+FRAME_MAGIC = b'RF'
+# 2 - геометрия вынесена из заголовка в screen_geometry
+FRAME_VERSION = 2
+
+# Тип кадра
+FRAME_KEY = 1
+FRAME_DELTA = 2
+
+# Формат изображения в кадре
+CODEC_JPEG = 1
+CODEC_WEBP = 2
+CODEC_PNG = 3
+# Формат Pillow для декодирования по номеру из заголовка
+CODEC_FORMATS = {CODEC_JPEG: 'JPEG', CODEC_WEBP: 'WEBP', CODEC_PNG: 'PNG'}
+
+# магия, версия, тип, формат, флаги, тег сессии, номер кадра, время, эпоха геометрии, число плиток
+FRAME_HEADER = struct.Struct('!2sBBBBIIdHH')
+TILE_ENTRY = struct.Struct('!HHI')
+
+FrameHeader = namedtuple('FrameHeader', [
+    'magic', 'version', 'kind', 'codec', 'flags', 'session_tag', 'frame_id', 'timestamp',
+    'geometry_epoch', 'tile_count'
+])
+
+# Параметры масштабирования кадра, которые нужны управляющему для пересчета координат
+GEOMETRY_FIELDS = (
+    "original_width", "original_height", "scaled_width", "scaled_height",
+    "offset_x", "offset_y", "scale_ratio", "origin_x", "origin_y"
+)
+
+# Положение указателя мыши - отдельное короткое двоичное сообщение, идет чаще кадров
+CURSOR_MAGIC = b'RC'
+CURSOR_VERSION = 1
+# Флаги указателя
+CURSOR_VISIBLE = 1
+# Формы указателя; в сообщении - номер в этом списке
+CURSOR_SHAPES = (
+    "arrow", "ibeam", "wait", "crosshair", "hand", "size_all",
+    "size_we", "size_ns", "size_nwse", "size_nesw", "no", "progress"
+)
+
+# магия, версия, флаги, тег сессии, номер, x и y в пикселях экрана, форма
+CURSOR_MESSAGE = struct.Struct('!2sBBIIiiB')
+
+CursorMessage = namedtuple('CursorMessage', [
+    'magic', 'version', 'flags', 'session_tag', 'sequence', 'x', 'y', 'shape'
+])
+
+def session_tag(session_id):
+    """Короткий тег сессии для заголовка кадра"""
+    return zlib.crc32(session_id.encode('utf-8'))
+
+def is_frame_message(message):
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:2]) == FRAME_MAGIC
+
+def is_cursor_message(message):
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:2]) == CURSOR_MAGIC
+
+def pack_header(kind, tag, frame_id, timestamp, epoch, tile_count=0, codec=CODEC_JPEG, flags=0):
+    return FRAME_HEADER.pack(
+        FRAME_MAGIC, FRAME_VERSION, kind, codec, flags, tag, frame_id & 0xFFFFFFFF, timestamp,
+        epoch & 0xFFFF, tile_count
+    )
+
+def encode_keyframe(tag, frame_id, timestamp, epoch, image_data, codec=CODEC_JPEG):
+    """Опорный кадр: заголовок и изображение целиком"""
+    return pack_header(FRAME_KEY, tag, frame_id, timestamp, epoch, codec=codec) + image_data
+
+def encode_delta(tag, frame_id, timestamp, epoch, tiles, codec=CODEC_JPEG):
+    """Дельта: заголовок, таблица плиток и их изображения; tiles - список (x, y, байты)"""
+    parts = [pack_header(FRAME_DELTA, tag, frame_id, timestamp, epoch, len(tiles), codec=codec)]
+    parts.extend(TILE_ENTRY.pack(x, y, len(data)) for x, y, data in tiles)
+    parts.extend(data for _, _, data in tiles)
+    return b''.join(parts)
+
+def decode_header(message):
+    """Разбор заголовка без копирования данных кадра; ValueError для чужого формата"""
+    if len(message) < FRAME_HEADER.size:
+        raise ValueError("Слишком короткий кадр")
+    header = FrameHeader._make(FRAME_HEADER.unpack_from(message))
+    if header.magic != FRAME_MAGIC:
+        raise ValueError("Не кадр экрана")
+    if header.version != FRAME_VERSION:
+        raise ValueError(f"Неподдерживаемая версия кадра: {header.version}")
+    if header.kind not in (FRAME_KEY, FRAME_DELTA):
+        raise ValueError(f"Неизвестный тип кадра: {header.kind}")
+    if header.codec not in CODEC_FORMATS:
+        raise ValueError(f"Неизвестный формат изображения: {header.codec}")
+    return header
+
+def geometry_message(epoch, geometry):
+    """JSON-сообщение с параметрами масштабирования для кадров эпохи epoch"""
+    return {"type": "screen_geometry", "epoch": epoch & 0xFFFF, **{field: geometry[field] for field in GEOMETRY_FIELDS}}
+
+def frame_payload(message):
+    """Данные изображения опорного кадра (memoryview без копирования)"""
+    return memoryview(message)[FRAME_HEADER.size:]
+
+def decode_tiles(header, message):
+    """Плитки дельты: список (x, y, memoryview с изображением)"""
+    view = memoryview(message)
+    table_end = FRAME_HEADER.size + header.tile_count * TILE_ENTRY.size
+    if table_end > len(view):
+        raise ValueError("Обрезанная таблица плиток дельта-кадра")
+    data_offset = table_end
+    tiles = []
+    for offset in range(FRAME_HEADER.size, table_end, TILE_ENTRY.size):
+        x, y, length = TILE_ENTRY.unpack_from(view, offset)
+        tiles.append((x, y, view[data_offset:data_offset + length]))
+        data_offset += length
+    if data_offset > len(view):
+        raise ValueError("Обрезанный дельта-кадр")
+    return tiles
+
+def encode_cursor(tag, sequence, x, y, shape=0, visible=True):
+    """Сообщение о положении и форме указателя; x, y - пиксели общего рабочего стола"""
+    flags = CURSOR_VISIBLE if visible else 0
+    return CURSOR_MESSAGE.pack(CURSOR_MAGIC, CURSOR_VERSION, flags, tag, sequence & 0xFFFFFFFF, x, y, shape)
+
+def decode_cursor(message):
+    """Разбор сообщения об указателе; ValueError для чужого формата"""
+    if len(message) != CURSOR_MESSAGE.size:
+        raise ValueError("Неверная длина сообщения указателя")
+    cursor = CursorMessage._make(CURSOR_MESSAGE.unpack(message))
+    if cursor.magic != CURSOR_MAGIC:
+        raise ValueError("Не сообщение указателя")
+    if cursor.version != CURSOR_VERSION:
+        raise ValueError(f"Неподдерживаемая версия сообщения указателя: {cursor.version}")
+    return cursor
@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# Выполнение команд ввода управляемого клиента в отдельном потоке.
+# Вызовы pyautogui блокируют (type_write ждет между символами), поэтому цикл событий
+# только ставит действие в очередь и сразу возвращается к кадрам и командам.
+
+# Сколько действий может ждать выполнения; движения мыши в очереди не копятся
+MAX_PENDING_ACTIONS = 256
+# Отпускания клавиш и кнопок не отбрасываются и не отменяются: иначе клавиша останется нажатой
+RELEASE_ACTIONS = ("keyUp", "mouseUp")
+
+class InputExecutor:
+    """Поток ввода с очередью действий
+
+    Подряд идущие движения мыши схлопываются в последнее: пока поток занят
+    (например, печатает текст), промежуточные положения указателя не нужны.
+    Нажатия и клавиши выполняются все и в исходном порядке.
+    clear() отменяет ожидающий ввод, например при отключении управления.
+    """
+    def __init__(self, backend, max_pending=MAX_PENDING_ACTIONS):
+        self.backend = backend
+        self.max_pending = max_pending
+        self.logger = logging.getLogger("InputExecutor")
+        self.actions = deque()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        # Номер отмены: печать текста прерывается, если он изменился
+        self.generation = 0
+        # Счетчики для статистики: выполнено и схлопнуто движений
+        self.executed = 0
+        self.coalesced = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="input", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Остановка потока; ожидающие отпускания клавиш и кнопок выполняются перед выходом"""
+        with self.condition:
+            self.running = False
+            self.generation += 1
+            released = [entry for entry in self.actions if entry[0] in RELEASE_ACTIONS]
+            self.actions.clear()
+            self.condition.notify()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        # Управляющий мог отключиться с зажатой клавишей: без этого она осталась бы нажатой
+        for action, args, kwargs in released:
+            try:
+                getattr(self.backend, action)(*args, _pause=False, **kwargs)
+                self.executed += 1
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка ввода {action}: {e}")
+
+    def clear(self):
+        """Отмена ожидающих действий и печатаемого текста; отпускания остаются"""
+        with self.condition:
+            self.generation += 1
+            released = [entry for entry in self.actions if entry[0] in RELEASE_ACTIONS]
+            dropped = len(self.actions) - len(released)
+            self.actions = deque(released)
+        if dropped:
+            self.logger.info(f"🧹 Отменено действий ввода: {dropped}")
+
+    def submit(self, action, *args, **kwargs):
+        """Постановка действия в очередь; action - имя функции pyautogui"""
+        with self.condition:
+            if action == "moveTo" and self.actions and self.actions[-1][0] == "moveTo":
+                self.actions[-1] = (action, args, kwargs)
+                self.coalesced += 1
+                return
+            if len(self.actions) >= self.max_pending and action not in RELEASE_ACTIONS:
+                self.logger.warning(f"⚠️ Очередь ввода переполнена ({len(self.actions)}), действие {action} пропущено")
+                return
+            self.actions.append((action, args, kwargs))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.actions:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                action, args, kwargs = self.actions.popleft()
+                generation = self.generation
+            try:
+                if action == "write":
+                    self.write(generation, *args, **kwargs)
+                else:
+                    getattr(self.backend, action)(*args, _pause=False, **kwargs)
+                self.executed += 1
+            except Exception as e:
+                self.logger.error(f"❌ Ошибка ввода {action}: {e}")
+
+    def write(self, generation, text, interval=0.0):
+        """Печать по одному символу, чтобы clear() мог прервать длинный текст"""
+        for char in text:
+            if self.generation != generation:
+                return
+            self.backend.write(char, _pause=False)
+            if interval:
+                time.sleep(interval)
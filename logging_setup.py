@@ -0,0 +1,127 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# Общая настройка логирования для сервера и клиентов.
+# Запись в консоль и файл выполняет фоновый поток QueueListener, поток цикла событий
+# и поток GUI только кладут запись в очередь. LOG_FORMAT=text|json, LOG_LEVEL=INFO,
+# LOG_SAMPLE_INTERVAL - не чаще одного сообщения за столько секунд для частых событий.
+
+DEFAULT_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_SAMPLE_INTERVAL = 5.0
+
+_listener = None
+_listener_pid = None
+
+class EventSampler(logging.Filter):
+    """Прореживание частых событий: запись с extra={"event": ...} проходит не чаще раза за interval
+
+    Пропущенные записи считаются, и их число добавляется к следующей прошедшей.
+    Записи без поля event не ограничиваются.
+    """
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        # событие -> [время последней прошедшей записи, пропущено с тех пор]
+        self.events = {}
+
+    def allow(self, event):
+        """Число пропущенных с прошлого раза событий или None, если событие нужно пропустить"""
+        now = time.monotonic()
+        state = self.events.get(event)
+        if state is None:
+            self.events[event] = [now, 0]
+            return 0
+        if now - state[0] < self.interval:
+            state[1] += 1
+            return None
+        suppressed = state[1]
+        state[0] = now
+        state[1] = 0
+        return suppressed
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or self.interval <= 0:
+            return True
+        suppressed = self.allow(event)
+        if suppressed is None:
+            return False
+        record.suppressed = suppressed
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} похожих)"
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись для сборщиков логов"""
+    def __init__(self, static_fields=None):
+        super().__init__()
+        self.static_fields = static_fields or {}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(self.static_fields)
+        for field in ("event", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+def log_format():
+    log_format = os.environ.get('LOG_FORMAT', 'text').lower()
+    if log_format not in ("text", "json"):
+        raise ValueError(f"Неизвестный формат логов: {log_format}")
+    return log_format
+
+def sample_interval():
+    return float(os.environ.get('LOG_SAMPLE_INTERVAL', DEFAULT_SAMPLE_INTERVAL))
+
+def stop_logging():
+    """Остановка фонового потока с дозаписью очереди"""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+def setup_logging(log_file=None, text_format=DEFAULT_TEXT_FORMAT, static_fields=None):
+    """Настройка корневого логгера через очередь; как и basicConfig, действует только первый вызов"""
+    global _listener, _listener_pid
+    # После fork поток записи остается в родительском процессе
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    if log_format() == "json":
+        formatter = JsonFormatter(static_fields)
+    else:
+        formatter = logging.Formatter(text_format)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(EventSampler(sample_interval()))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(stop_logging)
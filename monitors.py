@@ -0,0 +1,145 @@
+import ctypes
+import ctypes.util
+import sys
+
+# Перечисление мониторов управляемого компьютера.
+# Порядок источников: mss (если установлен), WinAPI EnumDisplayMonitors, XRandR через ctypes.
+# Координаты мониторов - в пикселях общего рабочего стола, как у pyautogui и ImageGrab(bbox).
+
+def monitor_entry(index, x, y, width, height, primary=False, name=None):
+    return {
+        "index": index,
+        "x": x,
+        "y": y,
+        "width": width,
+        "height": height,
+        "primary": primary,
+        "name": name or f"monitor{index}",
+    }
+
+def mss_monitors():
+    import mss
+    with mss.mss() as screen:
+        # monitors[0] - объединение всех мониторов, дальше - по одному; основной идет первым
+        return [
+            monitor_entry(index, monitor["left"], monitor["top"], monitor["width"], monitor["height"], index == 0)
+            for index, monitor in enumerate(screen.monitors[1:])
+        ]
+
+def win32_monitors():
+    from ctypes import wintypes
+
+    class MONITORINFOEXW(ctypes.Structure):
+        _fields_ = [
+            ("cbSize", wintypes.DWORD),
+            ("rcMonitor", wintypes.RECT),
+            ("rcWork", wintypes.RECT),
+            ("dwFlags", wintypes.DWORD),
+            ("szDevice", wintypes.WCHAR * 32),
+        ]
+
+    MONITORINFOF_PRIMARY = 1
+    user32 = ctypes.windll.user32
+    monitors = []
+
+    def callback(handle, hdc, rect, data):
+        info = MONITORINFOEXW()
+        info.cbSize = ctypes.sizeof(MONITORINFOEXW)
+        if user32.GetMonitorInfoW(handle, ctypes.byref(info)):
+            bounds = info.rcMonitor
+            monitors.append(monitor_entry(
+                len(monitors), bounds.left, bounds.top, bounds.right - bounds.left, bounds.bottom - bounds.top,
+                bool(info.dwFlags & MONITORINFOF_PRIMARY), info.szDevice
+            ))
+        return True
+
+    MONITORENUMPROC = ctypes.WINFUNCTYPE(
+        wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC, ctypes.POINTER(wintypes.RECT), wintypes.LPARAM
+    )
+    user32.EnumDisplayMonitors(None, None, MONITORENUMPROC(callback), 0)
+    return monitors
+
+def xrandr_monitors():
+    class XRRMonitorInfo(ctypes.Structure):
+        _fields_ = [
+            ("name", ctypes.c_ulong),
+            ("primary", ctypes.c_int),
+            ("automatic", ctypes.c_int),
+            ("noutput", ctypes.c_int),
+            ("x", ctypes.c_int),
+            ("y", ctypes.c_int),
+            ("width", ctypes.c_int),
+            ("height", ctypes.c_int),
+            ("mwidth", ctypes.c_int),
+            ("mheight", ctypes.c_int),
+            ("outputs", ctypes.POINTER(ctypes.c_ulong)),
+        ]
+
+    xlib_path = ctypes.util.find_library('X11')
+    xrandr_path = ctypes.util.find_library('Xrandr')
+    if not xlib_path or not xrandr_path:
+        return None
+    xlib = ctypes.CDLL(xlib_path)
+    xrandr = ctypes.CDLL(xrandr_path)
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+    xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    xlib.XGetAtomName.restype = ctypes.c_void_p
+    xlib.XGetAtomName.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    xlib.XFree.argtypes = [ctypes.c_void_p]
+    xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    xrandr.XRRGetMonitors.restype = ctypes.POINTER(XRRMonitorInfo)
+    xrandr.XRRGetMonitors.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int, ctypes.POINTER(ctypes.c_int)]
+    xrandr.XRRFreeMonitors.argtypes = [ctypes.POINTER(XRRMonitorInfo)]
+
+    display = xlib.XOpenDisplay(None)
+    if not display:
+        return None
+    try:
+        count = ctypes.c_int()
+        infos = xrandr.XRRGetMonitors(display, xlib.XDefaultRootWindow(display), True, ctypes.byref(count))
+        if not infos:
+            return None
+        monitors = []
+        for index in range(count.value):
+            info = infos[index]
+            name = None
+            atom_name = xlib.XGetAtomName(display, info.name)
+            if atom_name:
+                name = ctypes.string_at(atom_name).decode('utf-8', 'replace')
+                xlib.XFree(atom_name)
+            monitors.append(monitor_entry(index, info.x, info.y, info.width, info.height, bool(info.primary), name))
+        xrandr.XRRFreeMonitors(infos)
+        return monitors
+    finally:
+        xlib.XCloseDisplay(display)
+
+def enumerate_monitors(screen_size):
+    """Список мониторов; если ни один источник не сработал - один монитор размером screen_size"""
+    sources = [mss_monitors]
+    if sys.platform == 'win32':
+        sources.append(win32_monitors)
+    elif sys.platform.startswith('linux'):
+        sources.append(xrandr_monitors)
+    for source in sources:
+        try:
+            monitors = source()
+        except Exception:
+            monitors = None
+        if monitors:
+            # Основной монитор всегда один: если источник его не отметил, им считается первый
+            if not any(monitor["primary"] for monitor in monitors):
+                monitors[0]["primary"] = True
+            return monitors
+    width, height = screen_size
+    return [monitor_entry(0, 0, 0, width, height, True, "screen")]
+
+def desktop_bounds(monitors):
+    """Границы общего рабочего стола (left, top, right, bottom) по всем мониторам"""
+    return (
+        min(monitor["x"] for monitor in monitors),
+        min(monitor["y"] for monitor in monitors),
+        max(monitor["x"] + monitor["width"] for monitor in monitors),
+        max(monitor["y"] + monitor["height"] for monitor in monitors),
+    )
@@ -0,0 +1,80 @@
+import time
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity в запасе"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, amount):
+        """Списание токенов; возвращает, сколько секунд нужно подождать до их появления"""
+        self.refill()
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+class SessionLimits:
+    """Ограничения трафика по байтам и сообщениям в секунду
+
+    Кадры управляемого клиента расходуют ведро сессии, у управляющего и
+    каждого наблюдателя ведро свое: чужие сообщения кадры не задерживают.
+    """
+    def __init__(self, bytes_per_second, messages_per_second, max_message_size):
+        # Запас по байтам не меньше максимального сообщения, иначе оно никогда не пройдет
+        self.bytes = TokenBucket(bytes_per_second, max(bytes_per_second, max_message_size))
+        self.messages = TokenBucket(messages_per_second, messages_per_second)
+
+    def delay_for(self, size):
+        return max(self.bytes.consume(size), self.messages.consume(1))
+
+class AdmissionControl:
+    """Допуск новых подключений: лимит незавершенных рукопожатий и сессий с одного IP
+
+    max_sessions_per_ip 0 - сессии с одного адреса не ограничены.
+    """
+    def __init__(self, max_pending_handshakes, max_sessions_per_ip):
+        self.max_pending_handshakes = max_pending_handshakes
+        self.max_sessions_per_ip = max_sessions_per_ip
+        self.pending_handshakes = 0
+        # IP -> {session_id: число подключений из этой сессии}
+        self.ip_sessions = {}
+
+    def overloaded(self):
+        return self.pending_handshakes >= self.max_pending_handshakes
+
+    def begin_handshake(self):
+        if self.overloaded():
+            return False
+        self.pending_handshakes += 1
+        return True
+
+    def end_handshake(self):
+        self.pending_handshakes -= 1
+
+    def join(self, client_ip, session_id):
+        sessions = self.ip_sessions.setdefault(client_ip, {})
+        if (self.max_sessions_per_ip and session_id not in sessions
+                and len(sessions) >= self.max_sessions_per_ip):
+            if not sessions:
+                del self.ip_sessions[client_ip]
+            return False
+        sessions[session_id] = sessions.get(session_id, 0) + 1
+        return True
+
+    def leave(self, client_ip, session_id):
+        sessions = self.ip_sessions.get(client_ip)
+        if not sessions or session_id not in sessions:
+            return
+        sessions[session_id] -= 1
+        if sessions[session_id] <= 0:
+            del sessions[session_id]
+        if not sessions:
+            del self.ip_sessions[client_ip]
@@ -0,0 +1,217 @@
+import bisect
+import time
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DECODE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """Гистограмма в формате Prometheus с фиксированными корзинами"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels=()):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.total}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+class RateMeter:
+    """Скорость событий за последнюю полную секунду"""
+    def __init__(self):
+        self.second = int(time.monotonic())
+        self.current = 0
+        self.last = 0
+
+    def mark(self, amount=1):
+        now = int(time.monotonic())
+        if now != self.second:
+            self.last = self.current if now == self.second + 1 else 0
+            self.second = now
+            self.current = 0
+        self.current += amount
+
+    def rate(self):
+        now = int(time.monotonic())
+        if now == self.second:
+            return self.last
+        if now == self.second + 1:
+            return self.current
+        return 0
+
+class SessionMetrics:
+    """Счетчики трафика одной сессии"""
+    def __init__(self):
+        self.bytes_total = 0
+        self.frames_total = 0
+        self.bytes_rate = RateMeter()
+        self.frames_rate = RateMeter()
+
+    def record_message(self, size, is_frame):
+        self.bytes_total += size
+        self.bytes_rate.mark(size)
+        if is_frame:
+            self.frames_total += 1
+            self.frames_rate.mark()
+
+class RelayMetrics:
+    """Метрики ретранслятора для эндпоинта /metrics"""
+    def __init__(self):
+        self.started_at = time.time()
+        self.connections_total = 0
+        self.rejected_total = 0
+        self.messages_total = 0
+        self.dropped_frames_total = 0
+        self.throttled_seconds_total = 0.0
+        self.relay_latency = {
+            "priority": Histogram(LATENCY_BUCKETS),
+            "frame": Histogram(LATENCY_BUCKETS),
+            "cursor": Histogram(LATENCY_BUCKETS),
+        }
+        self.json_decode = Histogram(DECODE_BUCKETS)
+        self.sessions = {}
+
+    def session(self, session_id):
+        metrics = self.sessions.get(session_id)
+        if metrics is None:
+            metrics = SessionMetrics()
+            self.sessions[session_id] = metrics
+        return metrics
+
+    def forget_session(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def render(self, server):
+        """Текст метрик в формате Prometheus; состояние соединений берется у сервера"""
+        connections = {"controller": 0, "controlled": 0, "viewer": 0}
+        queue_depth = 0
+        queue_depth_max = 0
+        for session in server.sessions.values():
+            if session.controller_client:
+                connections["controller"] += 1
+            if session.controlled_client:
+                connections["controlled"] += 1
+            connections["viewer"] += len(session.viewers)
+            for channel in session.channels():
+                depth = channel.depth()
+                queue_depth += depth
+                queue_depth_max = max(queue_depth_max, depth)
+
+        worker = (("worker", server.worker_index),) if server.worker_count > 1 else ()
+        lines = [
+            "# HELP relay_uptime_seconds Seconds since the relay process started.",
+            "# TYPE relay_uptime_seconds gauge",
+            f"relay_uptime_seconds{format_labels(worker)} {time.time() - self.started_at:.3f}",
+            "# HELP relay_sessions Active relay sessions.",
+            "# TYPE relay_sessions gauge",
+            f"relay_sessions{format_labels(worker)} {len(server.sessions)}",
+            "# HELP relay_connections Connected clients by role.",
+            "# TYPE relay_connections gauge",
+        ]
+        for role, count in connections.items():
+            lines.append(f"relay_connections{format_labels(worker + (('role', role),))} {count}")
+        lines += [
+            "# HELP relay_connections_total Accepted WebSocket connections.",
+            "# TYPE relay_connections_total counter",
+            f"relay_connections_total{format_labels(worker)} {self.connections_total}",
+            "# HELP relay_rejected_total Connections rejected during initialization.",
+            "# TYPE relay_rejected_total counter",
+            f"relay_rejected_total{format_labels(worker)} {self.rejected_total}",
+            "# HELP relay_messages_total Messages received from clients.",
+            "# TYPE relay_messages_total counter",
+            f"relay_messages_total{format_labels(worker)} {self.messages_total}",
+            "# HELP relay_dropped_frames_total Stale screen frames replaced in egress queues.",
+            "# TYPE relay_dropped_frames_total counter",
+            f"relay_dropped_frames_total{format_labels(worker)} {self.dropped_frames_total}",
+            "# HELP relay_throttled_seconds_total Time clients were paused by session rate limits.",
+            "# TYPE relay_throttled_seconds_total counter",
+            f"relay_throttled_seconds_total{format_labels(worker)} {self.throttled_seconds_total:.3f}",
+            "# HELP relay_pending_handshakes Connections that have not sent their init message yet.",
+            "# TYPE relay_pending_handshakes gauge",
+            f"relay_pending_handshakes{format_labels(worker)} {server.admission.pending_handshakes}",
+            "# HELP relay_egress_queue_depth Messages waiting in all egress queues.",
+            "# TYPE relay_egress_queue_depth gauge",
+            f"relay_egress_queue_depth{format_labels(worker)} {queue_depth}",
+            "# HELP relay_egress_queue_depth_max Deepest single egress queue.",
+            "# TYPE relay_egress_queue_depth_max gauge",
+            f"relay_egress_queue_depth_max{format_labels(worker)} {queue_depth_max}",
+            "# HELP relay_latency_seconds Time from receiving a message to finishing its send.",
+            "# TYPE relay_latency_seconds histogram",
+        ]
+        for lane, histogram in self.relay_latency.items():
+            lines += histogram.render("relay_latency_seconds", worker + (("lane", lane),))
+        lines += [
+            "# HELP relay_json_decode_seconds Time spent decoding incoming JSON messages.",
+            "# TYPE relay_json_decode_seconds histogram",
+        ]
+        lines += self.json_decode.render("relay_json_decode_seconds", worker)
+
+        session_series = (
+            ("relay_session_bytes_total", "counter", "Bytes received from session clients.",
+             lambda metrics: metrics.bytes_total),
+            ("relay_session_frames_total", "counter", "Screen frames received in the session.",
+             lambda metrics: metrics.frames_total),
+            ("relay_session_bytes_per_second", "gauge", "Bytes received during the last full second.",
+             lambda metrics: metrics.bytes_rate.rate()),
+            ("relay_session_frames_per_second", "gauge", "Screen frames received during the last full second.",
+             lambda metrics: metrics.frames_rate.rate()),
+        )
+        for name, metric_type, help_text, value in session_series:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for session_id, metrics in self.sessions.items():
+                lines.append(f"{name}{format_labels(worker + (('session', session_id),))} {value(metrics)}")
+
+        return "\n".join(lines) + "\n"
+
+def merge_metrics(texts, worker_up):
+    """Объединение метрик нескольких воркеров в один ответ
+
+    В формате Prometheus у каждого семейства метрик одна пара HELP/TYPE, и все
+    его строки идут подряд, поэтому строки воркеров собираются по семействам.
+    worker_up - {номер воркера: ответил ли он}; воркеры без ответа видны в relay_worker_up.
+    """
+    families = {}
+    for text in texts:
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# HELP "):
+                name = line.split(" ", 3)[2]
+                family = families.get(name)
+                if family is None:
+                    family = families[name] = [line]
+            elif line.startswith("# TYPE "):
+                if family is not None and len(family) == 1:
+                    family.append(line)
+            elif line and family is not None:
+                family.append(line)
+    lines = [
+        "# HELP relay_worker_up Whether the worker answered the metrics scrape.",
+        "# TYPE relay_worker_up gauge",
+    ]
+    lines += [f"relay_worker_up{format_labels((('worker', index),))} {int(up)}" for index, up in sorted(worker_up.items())]
+    for family in families.values():
+        lines += family
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,170 @@
+import asyncio
+import websockets
+import multiprocessing
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import zlib
+
+# Типы кадров во внутреннем канале между воркерами
+LINK_TEXT = 0
+LINK_BINARY = 1
+LINK_CLOSE = 2
+LINK_HELLO = 3
+# Запрос метрик воркера и ответ с ними в текстовом формате Prometheus
+LINK_METRICS = 4
+
+LINK_HEADER = struct.Struct('!BI')
+
+def reuse_port_supported():
+    """Проверка поддержки SO_REUSEPORT на текущей платформе"""
+    return hasattr(socket, 'SO_REUSEPORT')
+
+def home_worker(session_id, worker_count):
+    """Воркер, который владеет сессией: все клиенты сессии сводятся к нему"""
+    return zlib.crc32(session_id.encode('utf-8')) % worker_count
+
+def socket_path(port, worker_index):
+    """Путь к unix-сокету воркера для межпроцессной маршрутизации"""
+    socket_dir = os.environ.get('RELAY_SOCKET_DIR', tempfile.gettempdir())
+    return os.path.join(socket_dir, f"relay-{port}-{worker_index}.sock")
+
+async def write_frame(writer, kind, payload=b""):
+    """Запись кадра во внутренний канал"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    writer.write(LINK_HEADER.pack(kind, len(payload)))
+    writer.write(payload)
+    await writer.drain()
+
+async def read_frame(reader):
+    """Чтение кадра из внутреннего канала; None при закрытии канала"""
+    try:
+        header = await reader.readexactly(LINK_HEADER.size)
+        kind, length = LINK_HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return kind, payload
+
+def encode_close(code, reason):
+    return struct.pack('!H', code) + reason.encode('utf-8')
+
+def decode_close(payload):
+    code, = struct.unpack_from('!H', payload)
+    return code, payload[2:].decode('utf-8', errors='replace')
+
+async def open_link(port, worker_index, retries=20):
+    """Подключение к unix-сокету воркера с ожиданием его запуска"""
+    path = socket_path(port, worker_index)
+    for attempt in range(retries):
+        try:
+            return await asyncio.open_unix_connection(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if attempt == retries - 1:
+                raise
+            await asyncio.sleep(0.1)
+
+class WorkerLink:
+    """Клиент, чье WebSocket-соединение принял другой воркер
+
+    Повторяет ту часть интерфейса соединения websockets, которую использует
+    сервер: recv, асинхронную итерацию, send, close и remote_address.
+    """
+    def __init__(self, reader, writer, remote_address):
+        self.reader = reader
+        self.writer = writer
+        self.remote_address = remote_address
+        self.closed = False
+
+    async def recv(self):
+        frame = await read_frame(self.reader)
+        if frame is None or frame[0] == LINK_CLOSE:
+            self.closed = True
+            raise websockets.exceptions.ConnectionClosedOK(None, None)
+        kind, payload = frame
+        if kind == LINK_TEXT:
+            return payload.decode('utf-8')
+        return payload
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        try:
+            while True:
+                yield await self.recv()
+        except websockets.exceptions.ConnectionClosedOK:
+            return
+
+    async def send(self, message):
+        if self.closed or self.writer.is_closing():
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+        kind = LINK_TEXT if isinstance(message, str) else LINK_BINARY
+        try:
+            await write_frame(self.writer, kind, message)
+        except ConnectionError:
+            self.closed = True
+            raise websockets.exceptions.ConnectionClosedError(None, None)
+
+    async def close(self, code=1000, reason=""):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await write_frame(self.writer, LINK_CLOSE, encode_close(code, reason))
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+async def pump_client_to_link(websocket, writer):
+    """Пересылка сообщений клиента воркеру-владельцу без разбора JSON"""
+    try:
+        async for message in websocket:
+            kind = LINK_TEXT if isinstance(message, str) else LINK_BINARY
+            await write_frame(writer, kind, message)
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+async def pump_link_to_client(reader, websocket):
+    """Пересылка сообщений воркера-владельца клиенту"""
+    while True:
+        frame = await read_frame(reader)
+        if frame is None:
+            await websocket.close()
+            return
+        kind, payload = frame
+        if kind == LINK_CLOSE:
+            code, reason = decode_close(payload)
+            await websocket.close(code, reason)
+            return
+        await websocket.send(payload.decode('utf-8') if kind == LINK_TEXT else payload)
+
+def run_workers(target, worker_count):
+    """Запуск воркеров в отдельных процессах и ожидание их завершения"""
+    processes = []
+    for worker_index in range(worker_count):
+        process = multiprocessing.Process(
+            target=target,
+            args=(worker_index, worker_count),
+            name=f"relay-worker-{worker_index}"
+        )
+        process.start()
+        processes.append(process)
+
+    # При SIGTERM (перезапуск на Railway) выходим через finally и гасим воркеров;
+    # обработчик ставится после запуска, чтобы воркеры его не унаследовали
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
@@ -1,91 +1,489 @@
 import asyncio
 import websockets
-import json
+import codec
 import logging
+from collections import deque
 from datetime import datetime
+from http import HTTPStatus
 import os
+import time
+from frame_protocol import FRAME_KEY, GEOMETRY_FIELDS, decode_cursor, decode_header, is_cursor_message, session_tag
+from logging_setup import setup_logging
+from relay_limits import AdmissionControl, SessionLimits
+from relay_metrics import RelayMetrics, merge_metrics
+from session_recorder import SessionRecorder
+from ws_compression import server_compression_options
+from relay_workers import (
+    WorkerLink, LINK_HELLO, LINK_METRICS, LINK_TEXT, home_worker, open_link, pump_client_to_link,
+    pump_link_to_client, read_frame, reuse_port_supported, run_workers, socket_path, write_frame
+)
+
+DEFAULT_SESSION_ID = "default"
+MAX_SESSION_ID_LENGTH = 64
+MAX_MESSAGE_SIZE = 5 * 1024 * 1024
+# Управляющий и наблюдатели отправляют только короткие JSON-сообщения
+MAX_CONTROL_MESSAGE_SIZE = 64 * 1024
+# Если сессия превысила лимит настолько, что ждать дольше этого, соединение закрывается
+MAX_THROTTLE_DELAY = 5.0
+# Повторный запрос полного кадра, если предыдущий запрос остался без ответа, с
+KEYFRAME_REQUEST_INTERVAL = 1.0
+# Сколько ждать метрик другого воркера при запросе /metrics, с
+METRICS_COLLECT_TIMEOUT = 1.0
+
+class EgressQueue:
+    """Ограниченная очередь исходящих сообщений получателя с отдельной задачей записи
+
+    Служебные сообщения (команды, статусы, ошибки) отправляются первыми и не
+    отбрасываются. Для кадров экрана хранится только последний: новый кадр
+    заменяет еще не отправленный. Дельта-кадр применим только поверх всех
+    предыдущих, поэтому вместо замены он отбрасывается, и получатель ждет
+    следующего полного кадра (needs_keyframe). Положение указателя тоже
+    хранится только последнее и отправляется раньше кадра.
+    """
+    def __init__(self, websocket, logger, metrics, max_pending=256):
+        self.websocket = websocket
+        self.logger = logger
+        self.metrics = metrics
+        self.max_pending = max_pending
+        self.priority = deque()
+        self.frame = None
+        self.cursor = None
+        self.dropped_frames = 0
+        self.needs_keyframe = False
+        self.closed = False
+        self.wakeup = asyncio.Event()
+        self.writer_task = asyncio.create_task(self.run_writer())
+
+    def depth(self):
+        return len(self.priority) + (1 if self.frame is not None else 0) + (1 if self.cursor is not None else 0)
+
+    def put_priority(self, message, received_at=None):
+        """Постановка служебного сообщения в очередь без потерь"""
+        if self.closed:
+            return
+        if len(self.priority) >= self.max_pending:
+            # Получатель не успевает принимать даже служебные сообщения
+            self.logger.warning(f"🐢 Очередь получателя переполнена ({len(self.priority)}), соединение закрывается")
+            self.closed = True
+            asyncio.create_task(self.websocket.close(code=1013, reason="egress queue overflow"))
+            return
+        self.priority.append((message, received_at))
+        self.wakeup.set()
+
+    def put_frame(self, message, received_at=None, keyframe=True):
+        """Постановка кадра экрана с заменой устаревшего"""
+        if self.closed:
+            return
+        if keyframe:
+            self.needs_keyframe = False
+        elif self.needs_keyframe or self.frame is not None:
+            # Получатель не успел принять предыдущий кадр: без этой дельты картинка
+            # разойдется с источником, поэтому ждем полный кадр
+            self.needs_keyframe = True
+            self.dropped_frames += 1
+            self.metrics.dropped_frames_total += 1
+            return
+        if self.frame is not None:
+            self.dropped_frames += 1
+            self.metrics.dropped_frames_total += 1
+        self.frame = (message, received_at)
+        self.wakeup.set()
+
+    def put_cursor(self, message, received_at=None):
+        """Положение указателя: важно только последнее, неотправленное заменяется"""
+        if self.closed:
+            return
+        self.cursor = (message, received_at)
+        self.wakeup.set()
+
+    async def run_writer(self):
+        """Отправка сообщений из очереди получателю"""
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                while self.priority or self.cursor is not None or self.frame is not None:
+                    if self.priority:
+                        lane = "priority"
+                        message, received_at = self.priority.popleft()
+                    elif self.cursor is not None:
+                        lane = "cursor"
+                        (message, received_at), self.cursor = self.cursor, None
+                    else:
+                        lane = "frame"
+                        (message, received_at), self.frame = self.frame, None
+                    await self.websocket.send(message)
+                    if received_at is not None:
+                        self.metrics.relay_latency[lane].observe(time.perf_counter() - received_at)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка отправки из очереди: {e}")
+        finally:
+            self.closed = True
+
+    async def close(self):
+        """Остановка задачи записи"""
+        self.closed = True
+        self.writer_task.cancel()
+        try:
+            await self.writer_task
+        except asyncio.CancelledError:
+            pass
+
+class RelaySession:
+    """Управляемый клиент, управляющий и наблюдатели, объединенные по session_id"""
+    def __init__(self, session_id):
+        self.session_id = session_id
+        # Тег сессии в заголовке двоичных кадров
+        self.tag = session_tag(session_id)
+        self.controller_client = None
+        self.controlled_client = None
+        self.viewers = set()
+        self.controlled_id = None
+        # Мониторы управляемого клиента из рукопожатия, передаются управляющим в controlled_connected
+        self.controlled_monitors = None
+        # Ограничения трафика управляемого клиента (SessionLimits); у управляющего
+        # и наблюдателей свои ведра, и кадры из-за них не задерживаются
+        self.limits = None
+        # Последние геометрия (screen_geometry) и полный кадр для мгновенного показа новым зрителям
+        self.geometry = None
+        self.last_frame = None
+        # Последнее положение указателя для новых зрителей
+        self.last_cursor = None
+        # Дельт после last_frame: если они были, новому зрителю нужен свежий полный кадр
+        self.deltas_since_keyframe = 0
+        # Время последнего запроса полного кадра у управляемого клиента
+        self.keyframe_requested_at = 0.0
+        # Необязательная запись сессии на диск
+        self.recorder = None
+
+    def is_empty(self):
+        return (self.controller_client is None and self.controlled_client is None
+                and not self.viewers)
+
+    def channels(self):
+        """Очереди всех клиентов сессии"""
+        if self.controlled_client:
+            yield self.controlled_client
+        yield from self.recipients()
+
+    def recipients(self):
+        """Все получатели экрана: управляющий и наблюдатели"""
+        if self.controller_client:
+            yield self.controller_client
+        yield from self.viewers
+
+    def broadcast_priority(self, message, received_at=None):
+        for channel in self.recipients():
+            channel.put_priority(message, received_at)
+
+    def broadcast_frame(self, message, received_at=None, keyframe=True):
+        for channel in self.recipients():
+            channel.put_frame(message, received_at, keyframe)
+        if any(channel.needs_keyframe for channel in self.recipients()):
+            self.request_keyframe()
+
+    def broadcast_cursor(self, message, received_at=None):
+        self.last_cursor = message
+        for channel in self.recipients():
+            channel.put_cursor(message, received_at)
+
+    def request_keyframe(self):
+        """Запрос полного кадра у управляемого клиента, не чаще раза за KEYFRAME_REQUEST_INTERVAL"""
+        now = time.monotonic()
+        if not self.controlled_client or now - self.keyframe_requested_at < KEYFRAME_REQUEST_INTERVAL:
+            return
+        self.keyframe_requested_at = now
+        self.controlled_client.put_priority(codec.dumps({
+            "type": "execute_command",
+            "command": "request_keyframe",
+            "data": None
+        }))
+
+    def controlled_connected_message(self):
+        return codec.dumps({
+            "type": "controlled_connected",
+            "client_id": self.controlled_id,
+            "monitors": self.controlled_monitors
+        })
+
+    def welcome(self, channel):
+        """Передача новому управляющему или наблюдателю текущего состояния сессии"""
+        if self.controlled_client:
+            channel.put_priority(self.controlled_connected_message())
+        if self.geometry:
+            channel.put_priority(self.geometry)
+        if self.last_cursor:
+            channel.put_cursor(self.last_cursor)
+        if self.last_frame:
+            channel.put_frame(self.last_frame)
+            if self.deltas_since_keyframe:
+                # Кэшированный кадр устарел, дельты после него новый получатель не видел
+                channel.needs_keyframe = True
+                self.request_keyframe()
 
 class WebSocketRemoteServer:
-    def __init__(self):
+    def __init__(self, worker_index=0, worker_count=1):
         self.port = int(os.environ.get('PORT', 8000))
         self.host = "0.0.0.0"
-        self.controller_client = None
-        self.controlled_client = None
+        # Номер воркера и их общее число в многопроцессном режиме
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        # Реестр сессий: session_id -> RelaySession
+        self.sessions = {}
+        self.egress_max_pending = int(os.environ.get('EGRESS_MAX_PENDING', 256))
+        self.metrics = RelayMetrics()
+        # Каталог для записи сессий; запись включается только при его наличии
+        self.record_dir = os.environ.get('RECORD_DIR')
+        self.record_segment_bytes = int(os.environ.get('RECORD_SEGMENT_MB', 64)) * 1024 * 1024
+        # Допуск подключений и лимиты трафика сессий. Лимит сессий с одного IP по умолчанию
+        # выключен: за прокси без TRUST_FORWARDED_FOR=1 у всех клиентов адрес прокси
+        self.admission = AdmissionControl(
+            int(os.environ.get('MAX_PENDING_HANDSHAKES', 128)),
+            int(os.environ.get('MAX_SESSIONS_PER_IP', 0))
+        )
+        self.session_bytes_per_second = int(os.environ.get('SESSION_MAX_BYTES_PER_SEC', 20 * 1024 * 1024))
+        self.session_messages_per_second = int(os.environ.get('SESSION_MAX_MESSAGES_PER_SEC', 1000))
+        self.client_bytes_per_second = int(os.environ.get('CLIENT_MAX_BYTES_PER_SEC', 256 * 1024))
+        self.client_messages_per_second = int(os.environ.get('CLIENT_MAX_MESSAGES_PER_SEC', 200))
+        # За прокси (Railway) адрес клиента приходит в заголовках прокси; включается явно
+        # (TRUST_FORWARDED_FOR=1): без прокси эти заголовки пишет сам клиент
+        self.trust_forwarded_for = os.environ.get('TRUST_FORWARDED_FOR', '0') == '1'
         self.setup_logging()
 
     def setup_logging(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[logging.StreamHandler()]
-        )
+        log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        if self.worker_count > 1:
+            log_format = f'%(asctime)s - [worker {self.worker_index}] %(levelname)s - %(message)s'
+        static_fields = {"worker": self.worker_index} if self.worker_count > 1 else None
+        setup_logging(text_format=log_format, static_fields=static_fields)
         self.logger = logging.getLogger(__name__)
 
+    def get_session(self, session_id):
+        """Получение сессии по идентификатору с созданием при необходимости"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = RelaySession(session_id)
+            session.limits = SessionLimits(
+                self.session_bytes_per_second, self.session_messages_per_second, MAX_MESSAGE_SIZE
+            )
+            if self.record_dir:
+                session.recorder = SessionRecorder(self.record_dir, session_id, self.record_segment_bytes)
+                self.logger.info(f"📼 Запись сессии {session_id} в {session.recorder.directory}")
+            self.sessions[session_id] = session
+            self.logger.info(f"🆕 Создана сессия {session_id} (всего сессий: {len(self.sessions)})")
+        return session
+
+    def release_session(self, session):
+        """Удаление сессии из реестра, если в ней не осталось клиентов"""
+        if session.is_empty() and self.sessions.get(session.session_id) is session:
+            del self.sessions[session.session_id]
+            self.metrics.forget_session(session.session_id)
+            if session.recorder:
+                session.recorder.close()
+            self.logger.info(f"🗑️ Сессия {session.session_id} закрыта (всего сессий: {len(self.sessions)})")
+
+    def client_address(self, websocket):
+        """IP клиента с учетом заголовков доверенного прокси
+
+        Берется X-Real-IP или последний адрес X-Forwarded-For - тот, что дописал
+        сам прокси; адреса левее мог подставить клиент.
+        """
+        request = getattr(websocket, "request", None)
+        if self.trust_forwarded_for and request is not None:
+            real_ip = request.headers.get("X-Real-IP")
+            if real_ip and real_ip.strip():
+                return real_ip.strip()
+            forwarded = request.headers.get("X-Forwarded-For")
+            if forwarded:
+                hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+                if hops:
+                    return hops[-1]
+        return websocket.remote_address[0] if websocket.remote_address else "unknown"
+
     async def handle_client(self, websocket):
         """Обработка нового клиента"""
-        client_ip = websocket.remote_address[0] if websocket.remote_address else "unknown"
+        client_ip = self.client_address(websocket)
         self.logger.info(f"🔗 Новый клиент подключился из {client_ip}")
+        # Рукопожатие проксируемого клиента уже учтено воркером, который его принял
+        handshaking = not isinstance(websocket, WorkerLink)
+        if handshaking:
+            self.metrics.connections_total += 1
+            if not self.admission.begin_handshake():
+                self.logger.warning(f"🚦 Слишком много незавершенных подключений, отказ {client_ip}")
+                self.metrics.rejected_total += 1
+                await websocket.close(code=1013, reason="server busy")
+                return
 
         client_type = None
         client_id = None
+        session = None
+        channel = None
+        joined_session_id = None
         
         try:
             # Получаем тип клиента
-            init_message = await asyncio.wait_for(websocket.recv(), timeout=30.0)
-            init_data = json.loads(init_message)
+            try:
+                init_message = await asyncio.wait_for(websocket.recv(), timeout=30.0)
+            finally:
+                if handshaking:
+                    self.admission.end_handshake()
+                    handshaking = False
+            init_data = codec.loads(init_message)
             client_type = init_data.get("type")
             client_id = init_data.get("client_id", "unknown")
+            if client_type != "controlled":
+                # Большие сообщения отправляет только управляемый клиент: остальным
+                # websockets откажет еще до приема всего сообщения
+                protocol = getattr(websocket, "protocol", None)
+                if protocol is not None:
+                    # websockets 15+ хранит лимит в max_message_size, 14 - в max_size
+                    if hasattr(protocol, "max_message_size"):
+                        protocol.max_message_size = MAX_CONTROL_MESSAGE_SIZE
+                    else:
+                        protocol.max_size = MAX_CONTROL_MESSAGE_SIZE
+            session_id = str(init_data.get("session_id") or DEFAULT_SESSION_ID)
+
+            if len(session_id) > MAX_SESSION_ID_LENGTH:
+                await websocket.send(codec.dumps({
+                    "type": "error",
+                    "message": "Слишком длинный идентификатор сессии"
+                }))
+                self.metrics.rejected_total += 1
+                await websocket.close()
+                return
+
+            # Сессия принадлежит другому воркеру - передаем соединение ему
+            if self.worker_count > 1 and not isinstance(websocket, WorkerLink):
+                owner = home_worker(session_id, self.worker_count)
+                if owner != self.worker_index:
+                    await self.proxy_to_worker(websocket, init_message, owner, client_ip)
+                    return
+
+            if not self.admission.join(client_ip, session_id):
+                self.logger.warning(f"🚦 Превышен лимит сессий для {client_ip}")
+                await websocket.send(codec.dumps({
+                    "type": "error",
+                    "message": "Слишком много сессий с вашего адреса"
+                }))
+                self.metrics.rejected_total += 1
+                await websocket.close(code=1008, reason="too many sessions")
+                return
+            joined_session_id = session_id
 
             if client_type == "controller":
-                if self.controller_client:
-                    await websocket.send(json.dumps({
+                session = self.get_session(session_id)
+                if session.controller_client:
+                    await websocket.send(codec.dumps({
                         "type": "error",
                         "message": "Управляющий клиент уже подключен"
                     }))
+                    self.metrics.rejected_total += 1
                     await websocket.close()
                     return
-                self.controller_client = websocket
-                self.logger.info(f"🎮 Подключен управляющий клиент: {client_id}")
-                await websocket.send(json.dumps({
+                channel = EgressQueue(websocket, self.logger, self.metrics, self.egress_max_pending)
+                session.controller_client = channel
+                if session.controlled_client:
+                    # Управляемый клиент ждет подтверждений показа кадров только от управляющего
+                    session.controlled_client.put_priority(codec.dumps({"type": "controller_connected"}))
+                self.logger.info(f"🎮 Подключен управляющий клиент: {client_id} (сессия {session_id})")
+                channel.put_priority(codec.dumps({
+                    "type": "connection_established",
+                    "role": "controller",
+                    "session_id": session_id
+                }))
+                session.welcome(channel)
+
+            elif client_type == "viewer":
+                session = self.get_session(session_id)
+                channel = EgressQueue(websocket, self.logger, self.metrics, self.egress_max_pending)
+                session.viewers.add(channel)
+                self.logger.info(f"👁️ Подключен наблюдатель: {client_id} (сессия {session_id}, наблюдателей: {len(session.viewers)})")
+                channel.put_priority(codec.dumps({
                     "type": "connection_established",
-                    "role": "controller"
+                    "role": "viewer",
+                    "session_id": session_id
                 }))
+                session.welcome(channel)
 
             elif client_type == "controlled":
-                if self.controlled_client:
-                    await websocket.send(json.dumps({
+                session = self.get_session(session_id)
+                if session.controlled_client:
+                    await websocket.send(codec.dumps({
                         "type": "error", 
                         "message": "Управляемый клиент уже подключен"
                     }))
+                    self.metrics.rejected_total += 1
                     await websocket.close()
                     return
-                self.controlled_client = websocket
-                self.logger.info(f"🖥️ Подключен управляемый клиент: {client_id}")
-                await websocket.send(json.dumps({
+                channel = EgressQueue(websocket, self.logger, self.metrics, self.egress_max_pending)
+                session.controlled_client = channel
+                session.controlled_id = client_id
+                monitors = init_data.get("monitors")
+                session.controlled_monitors = monitors if isinstance(monitors, list) else None
+                self.logger.info(f"🖥️ Подключен управляемый клиент: {client_id} (сессия {session_id})")
+                channel.put_priority(codec.dumps({
                     "type": "connection_established",
-                    "role": "controlled"
+                    "role": "controlled",
+                    "session_id": session_id
                 }))
+                if session.controller_client:
+                    channel.put_priority(codec.dumps({"type": "controller_connected"}))
 
-                # Уведомляем управляющего
-                if self.controller_client:
-                    await self.controller_client.send(json.dumps({
-                        "type": "controlled_connected",
-                        "client_id": client_id
-                    }))
+                # Уведомляем управляющего и наблюдателей
+                session.broadcast_priority(session.controlled_connected_message())
 
             else:
-                await websocket.send(json.dumps({
+                await websocket.send(codec.dumps({
                     "type": "error",
                     "message": "Неизвестный тип клиента"
                 }))
+                self.metrics.rejected_total += 1
                 await websocket.close()
                 return
 
             # Основной цикл обработки сообщений
+            session_metrics = self.metrics.session(session.session_id)
+            if client_type == "controlled":
+                limits, max_size = session.limits, MAX_MESSAGE_SIZE
+            else:
+                limits = SessionLimits(
+                    self.client_bytes_per_second, self.client_messages_per_second, MAX_CONTROL_MESSAGE_SIZE
+                )
+                max_size = MAX_CONTROL_MESSAGE_SIZE
             async for message in websocket:
+                if len(message) > max_size:
+                    # Проксированный клиент: его размер сообщений не ограничен websockets этого воркера
+                    self.logger.warning(f"🚦 Слишком большое сообщение от {client_type}: {len(message)} байт")
+                    await websocket.close(code=1009, reason="message too big")
+                    break
+                # Лимиты проверяются до разбора JSON: превысивший их клиент просто
+                # перестает читаться, и TCP притормаживает отправителя
+                delay = limits.delay_for(len(message))
+                if delay > MAX_THROTTLE_DELAY:
+                    self.logger.warning(f"🚦 Клиент {client_type} сессии {session.session_id} превысил лимит трафика и отключен")
+                    await websocket.close(code=1008, reason="rate limit exceeded")
+                    break
+                if delay > 0:
+                    self.metrics.throttled_seconds_total += delay
+                    await asyncio.sleep(delay)
+
                 try:
-                    data = json.loads(message)
-                    await self.route_message(data, websocket, client_type)
+                    received_at = time.perf_counter()
+                    self.metrics.messages_total += 1
+                    if isinstance(message, bytes):
+                        # Двоичный кадр экрана: разбирается только заголовок
+                        session_metrics.record_message(len(message), True)
+                        if is_cursor_message(message):
+                            self.route_cursor(message, client_type, session, received_at)
+                        else:
+                            self.route_frame(message, client_type, session, received_at)
+                        continue
+                    data = codec.loads(message)
+                    self.metrics.json_decode.observe(time.perf_counter() - received_at)
+                    session_metrics.record_message(len(message), False)
+                    await self.route_message(data, channel, client_type, session, received_at)
                     
                 except Exception as e:
                     self.logger.error(f"❌ Ошибка обработки сообщения: {e}")
@@ -98,53 +496,237 @@ class WebSocketRemoteServer:
         except Exception as e:
             self.logger.error(f"❌ Неожиданная ошибка: {e}")
         finally:
-            # Очистка при отключении
-            if client_type == "controller" and websocket == self.controller_client:
-                self.controller_client = None
-                self.logger.info("🎮 Управляющий клиент отключен")
-            elif client_type == "controlled" and websocket == self.controlled_client:
-                self.controlled_client = None
-                self.logger.info("🖥️ Управляемый клиент отключен")
-                
-                if self.controller_client:
-                    await self.controller_client.send(json.dumps({
-                        "type": "controlled_disconnected"
-                    }))
+            # Очистка сессии при отключении
+            if session is not None and channel is not None:
+                await self.cleanup_client(session, channel, client_type)
+            if joined_session_id is not None:
+                self.admission.leave(client_ip, joined_session_id)
+
+    async def proxy_to_worker(self, websocket, init_message, owner, client_ip):
+        """Проксирование клиента воркеру-владельцу сессии через unix-сокет"""
+        reader, writer = await open_link(self.port, owner)
+        self.logger.info(f"🔀 Клиент {client_ip} передан воркеру {owner}")
+        try:
+            await write_frame(writer, LINK_HELLO, client_ip)
+            await write_frame(writer, LINK_TEXT, init_message)
 
-    async def route_message(self, data, websocket, sender_type):
-        """Маршрутизация сообщений между клиентами"""
+            upstream = asyncio.create_task(pump_client_to_link(websocket, writer))
+            downstream = asyncio.create_task(pump_link_to_client(reader, websocket))
+            done, pending = await asyncio.wait(
+                {upstream, downstream}, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def handle_link(self, reader, writer):
+        """Прием клиента, проксируемого другим воркером"""
+        try:
+            frame = await read_frame(reader)
+            if frame is not None and frame[0] == LINK_METRICS:
+                # Воркер, принявший запрос /metrics, собирает метрики всех воркеров
+                await write_frame(writer, LINK_METRICS, self.metrics.render(self))
+                return
+            if frame is None or frame[0] != LINK_HELLO:
+                return
+            client_ip = frame[1].decode('utf-8')
+            await self.handle_client(WorkerLink(reader, writer, (client_ip, 0)))
+        finally:
+            writer.close()
+
+    async def cleanup_client(self, session, channel, client_type):
+        """Удаление клиента из его сессии"""
+        await channel.close()
+        if channel.dropped_frames:
+            self.logger.info(f"📉 Отброшено устаревших кадров для клиента {client_type}: {channel.dropped_frames}")
+
+        if client_type == "controller" and channel is session.controller_client:
+            session.controller_client = None
+            self.logger.info(f"🎮 Управляющий клиент отключен (сессия {session.session_id})")
+            if session.controlled_client:
+                # Подтверждений кадров больше не будет: окно управляемого клиента снимается
+                session.controlled_client.put_priority(codec.dumps({"type": "controller_disconnected"}))
+        elif client_type == "viewer" and channel in session.viewers:
+            session.viewers.discard(channel)
+            self.logger.info(f"👁️ Наблюдатель отключен (сессия {session.session_id}, наблюдателей: {len(session.viewers)})")
+        elif client_type == "controlled" and channel is session.controlled_client:
+            session.controlled_client = None
+            session.controlled_id = None
+            session.controlled_monitors = None
+            session.geometry = None
+            session.last_frame = None
+            session.last_cursor = None
+            session.deltas_since_keyframe = 0
+            self.logger.info(f"🖥️ Управляемый клиент отключен (сессия {session.session_id})")
+            
+            session.broadcast_priority(codec.dumps({
+                "type": "controlled_disconnected"
+            }))
+
+        self.release_session(session)
+
+    async def route_message(self, data, channel, sender_type, session, received_at=None):
+        """Маршрутизация сообщений между клиентами одной сессии"""
         message_type = data.get("type")
         
-        if sender_type == "controller" and message_type == "control_command":
-            if self.controlled_client:
-                await self.controlled_client.send(json.dumps({
+        if sender_type == "viewer" and message_type == "control_command":
+            # Наблюдатель может только запросить экран, но не управлять
+            if data.get("command") not in ("capture_screen", "request_keyframe"):
+                channel.put_priority(codec.dumps({
+                    "type": "error",
+                    "message": "Наблюдатель не может отправлять команды управления"
+                }))
+            elif session.controlled_client:
+                session.controlled_client.put_priority(codec.dumps({
                     "type": "execute_command",
                     "command": data.get("command"),
-                    "data": data.get("data")
-                }))
+                    "data": None
+                }), received_at)
             else:
-                await websocket.send(json.dumps({
+                channel.put_priority(codec.dumps({
                     "type": "error",
                     "message": "Нет подключенного управляемого клиента"
                 }))
-                
-        elif sender_type == "controlled" and message_type == "screen_data":
-            if self.controller_client:
-                await self.controller_client.send(json.dumps({
-                    "type": "screen_update",
-                    "screen_data": data.get("screen_data")
+
+        elif sender_type == "controller" and message_type == "control_command":
+            if session.recorder:
+                session.recorder.record_command({"command": data.get("command"), "data": data.get("data")})
+            if session.controlled_client:
+                session.controlled_client.put_priority(codec.dumps({
+                    "type": "execute_command",
+                    "command": data.get("command"),
+                    "data": data.get("data")
+                }), received_at)
+            else:
+                channel.put_priority(codec.dumps({
+                    "type": "error",
+                    "message": "Нет подключенного управляемого клиента"
                 }))
                 
+        elif sender_type == "controller" and message_type == "frame_ack":
+            # Подтверждение показа кадра: управляемый клиент держит по ним окно неподтвержденных кадров.
+            # Учитываются только подтверждения управляющего: быстрый наблюдатель не должен
+            # открывать окно за медленного управляющего. Подтверждения накопительные
+            frame_id = data.get("frame_id")
+            if session.controlled_client and isinstance(frame_id, int):
+                session.controlled_client.put_priority(codec.dumps({
+                    "type": "frame_ack",
+                    "frame_id": frame_id
+                }), received_at)
+
+        elif sender_type == "controlled" and message_type == "screen_geometry":
+            # Геометрия меняется редко: кэшируется для новых зрителей и идет служебной очередью,
+            # поэтому обгоняет кадры, которые на нее ссылаются
+            session.geometry = codec.dumps({
+                "type": "screen_geometry",
+                "epoch": data.get("epoch"),
+                **{field: data.get(field) for field in GEOMETRY_FIELDS}
+            })
+            session.broadcast_priority(session.geometry, received_at)
+
         elif sender_type == "controlled" and message_type == "status_update":
-            if self.controller_client:
-                await self.controller_client.send(json.dumps({
-                    "type": "controlled_status",
-                    "info": data.get("info")
-                }))
+            status = {
+                "type": "controlled_status",
+                "info": data.get("info")
+            }
+            # Параметры потока экрана (качество, разрешение, FPS) передаются как есть
+            if data.get("stream") is not None:
+                status["stream"] = data["stream"]
+            session.broadcast_priority(codec.dumps(status), received_at)
+
+    def route_frame(self, message, sender_type, session, received_at=None):
+        """Маршрутизация двоичного кадра экрана по заголовку
+
+        Сообщение не разбирается и не копируется: один и тот же объект bytes
+        уходит всем получателям и в кэш последнего кадра.
+        """
+        if sender_type != "controlled":
+            return
+        header = decode_header(message)
+        if header.session_tag != session.tag:
+            self.logger.warning(f"⚠️ Кадр с тегом чужой сессии в сессии {session.session_id}", extra={"event": "foreign_frame"})
+            return
+        if session.recorder:
+            session.recorder.record_screen(message)
+        if header.kind == FRAME_KEY:
+            session.last_frame = message
+            session.deltas_since_keyframe = 0
+            session.broadcast_frame(message, received_at)
+        else:
+            session.deltas_since_keyframe += 1
+            session.broadcast_frame(message, received_at, keyframe=False)
+
+    def route_cursor(self, message, sender_type, session, received_at=None):
+        """Пересылка положения указателя отдельной полосой, как и кадры - без копирования"""
+        if sender_type != "controlled":
+            return
+        cursor = decode_cursor(message)
+        if cursor.session_tag != session.tag:
+            self.logger.warning(f"⚠️ Указатель с тегом чужой сессии в сессии {session.session_id}", extra={"event": "foreign_cursor"})
+            return
+        session.broadcast_cursor(message, received_at)
+
+    async def worker_metrics(self, worker_index):
+        """Метрики другого воркера через его внутренний канал"""
+        reader, writer = await open_link(self.port, worker_index, retries=1)
+        try:
+            await write_frame(writer, LINK_METRICS)
+            frame = await read_frame(reader)
+        finally:
+            writer.close()
+        if frame is None or frame[0] != LINK_METRICS:
+            raise ConnectionError(f"воркер {worker_index} не вернул метрики")
+        return frame[1].decode('utf-8')
+
+    async def collect_metrics(self):
+        """Метрики всего ретранслятора: запрос /metrics попадает к случайному воркеру
+        (SO_REUSEPORT), поэтому он опрашивает остальные и отдает общий ответ"""
+        if self.worker_count <= 1:
+            return self.metrics.render(self)
+        others = [index for index in range(self.worker_count) if index != self.worker_index]
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self.worker_metrics(index), METRICS_COLLECT_TIMEOUT) for index in others),
+            return_exceptions=True
+        )
+        texts = [self.metrics.render(self)]
+        worker_up = {self.worker_index: True}
+        for index, result in zip(others, results):
+            worker_up[index] = not isinstance(result, BaseException)
+            if worker_up[index]:
+                texts.append(result)
+            else:
+                self.logger.warning(f"⚠️ Метрики воркера {index} недоступны: {result!r}")
+        return merge_metrics(texts, worker_up)
+
+    async def process_request(self, connection, request):
+        """Ответ на обычные HTTP-запросы /healthz и /metrics на порту WebSocket"""
+        path = request.path.split('?', 1)[0]
+        if path == "/healthz":
+            return connection.respond(HTTPStatus.OK, "ok\n")
+        if path == "/metrics":
+            response = connection.respond(HTTPStatus.OK, await self.collect_metrics())
+            del response.headers["Content-Type"]
+            response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+            return response
+        if self.admission.overloaded():
+            # Отказываем еще до WebSocket-рукопожатия
+            self.metrics.rejected_total += 1
+            return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy\n")
+        return None
 
     async def start_server(self):
         """Запуск WebSocket сервера"""
-        self.logger.info(f"🚀 Запуск сервера на {self.host}:{self.port}")
+        self.logger.info(f"🚀 Запуск сервера на {self.host}:{self.port} ({codec.describe()})")
+
+        sharded = self.worker_count > 1
+        if sharded:
+            # Внутренний канал, через который другие воркеры передают клиентов этой шарды
+            path = socket_path(self.port, self.worker_index)
+            if os.path.exists(path):
+                os.unlink(path)
+            link_server = await asyncio.start_unix_server(self.handle_link, path=path)
 
         start_server = websockets.serve(
             self.handle_client, 
@@ -152,17 +734,41 @@ class WebSocketRemoteServer:
             self.port,
             ping_interval=30,
             ping_timeout=10,
-            max_size=5 * 1024 * 1024
+            max_size=MAX_MESSAGE_SIZE,
+            process_request=self.process_request,
+            reuse_port=sharded,
+            **server_compression_options()
         )
         
-        async with start_server:
-            self.logger.info("✅ Сервер успешно запущен")
-            await asyncio.Future()
+        try:
+            async with start_server:
+                self.logger.info("✅ Сервер успешно запущен")
+                await asyncio.Future()
+        finally:
+            if sharded:
+                link_server.close()
+
+def run_worker(worker_index, worker_count):
+    """Точка входа процесса-воркера"""
+    server = WebSocketRemoteServer(worker_index, worker_count)
+    try:
+        codec.run(server.start_server())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
-    server = WebSocketRemoteServer()
+    workers = int(os.environ.get('WORKERS', 1))
+    if workers > 1 and not reuse_port_supported():
+        print("⚠️ SO_REUSEPORT не поддерживается, запуск в одном процессе")
+        workers = 1
+
     try:
-        asyncio.run(server.start_server())
+        if workers > 1:
+            print(f"🧩 Запуск {workers} воркеров на одном порту")
+            run_workers(run_worker, workers)
+        else:
+            server = WebSocketRemoteServer()
+            codec.run(server.start_server())
     except KeyboardInterrupt:
         print("\n🛑 Сервер остановлен")
     except Exception as e:
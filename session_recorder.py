@@ -0,0 +1,221 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Формат сегмента: заголовок файла, затем записи "заголовок записи + данные"
+SEGMENT_MAGIC = b"RRS1"
+RECORD_HEADER = struct.Struct('<dBI')   # время, тип записи, длина данных
+INDEX_ENTRY = struct.Struct('<dQ')      # время, смещение записи в сегменте
+
+RECORD_COMMAND = 2
+# Двоичный кадр экрана целиком (заголовок frame_protocol и изображение)
+RECORD_SCREEN = 4
+
+RECORD_KIND_NAMES = {RECORD_COMMAND: "command", RECORD_SCREEN: "screen"}
+
+def safe_name(session_id):
+    """Имя каталога для сессии без символов, недопустимых в путях"""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id).strip('.')
+    return name or "session"
+
+class SessionRecorder:
+    """Запись сессии в сегменты только на дозапись с индексом время -> смещение
+
+    Ретранслятор лишь кладет записи в ограниченную очередь; декодирование,
+    сериализация и запись на диск выполняются в фоновом потоке. При
+    переполнении очереди записи отбрасываются, а не тормозят ретрансляцию.
+    """
+    def __init__(self, root_dir, session_id, segment_bytes=64 * 1024 * 1024, max_pending=256):
+        self.logger = logging.getLogger(__name__)
+        started = datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.directory = os.path.join(root_dir, f"{safe_name(session_id)}-{started}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.stopping = threading.Event()
+        self.dropped = 0
+        self.segment_index = -1
+        self.segment_file = None
+        self.index_file = None
+        self.segment_size = 0
+        self.writer_thread = threading.Thread(
+            target=self.run_writer, name=f"recorder-{session_id}", daemon=True
+        )
+        self.writer_thread.start()
+
+    def record_screen(self, message, timestamp=None):
+        """Двоичный кадр экрана в формате frame_protocol"""
+        self.enqueue(RECORD_SCREEN, message, timestamp)
+
+    def record_command(self, command, timestamp=None):
+        """Команда управления: словарь или готовая JSON-строка"""
+        self.enqueue(RECORD_COMMAND, command, timestamp)
+
+    def enqueue(self, kind, payload, timestamp):
+        if self.stopping.is_set():
+            return
+        try:
+            self.pending.put_nowait((timestamp or time.time(), kind, payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Завершение записи; оставшиеся в очереди записи будут дописаны"""
+        self.stopping.set()
+
+    def run_writer(self):
+        try:
+            while not (self.stopping.is_set() and self.pending.empty()):
+                try:
+                    timestamp, kind, payload = self.pending.get(timeout=0.5)
+                except queue.Empty:
+                    self.flush()
+                    continue
+                self.write_record(timestamp, kind, self.encode_payload(kind, payload))
+                if self.pending.empty():
+                    self.flush()
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка записи сессии: {e}")
+        finally:
+            self.close_segment()
+            if self.dropped:
+                self.logger.warning(f"⚠️ Запись {self.directory}: отброшено {self.dropped} записей")
+
+    def encode_payload(self, kind, payload):
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            return payload
+        if isinstance(payload, str):
+            return payload.encode('utf-8')
+        return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+    def write_record(self, timestamp, kind, data):
+        if self.segment_file is None or self.segment_size >= self.segment_bytes:
+            self.open_segment()
+        self.index_file.write(INDEX_ENTRY.pack(timestamp, self.segment_size))
+        self.segment_file.write(RECORD_HEADER.pack(timestamp, kind, len(data)))
+        self.segment_file.write(data)
+        self.segment_size += RECORD_HEADER.size + len(data)
+
+    def open_segment(self):
+        self.close_segment()
+        self.segment_index += 1
+        base = os.path.join(self.directory, f"{self.segment_index:06d}")
+        self.segment_file = open(base + ".seg", "wb")
+        self.index_file = open(base + ".idx", "wb")
+        self.segment_file.write(SEGMENT_MAGIC)
+        self.segment_size = len(SEGMENT_MAGIC)
+
+    def flush(self):
+        if self.segment_file:
+            self.segment_file.flush()
+            self.index_file.flush()
+
+    def close_segment(self):
+        if self.segment_file:
+            self.segment_file.close()
+            self.index_file.close()
+            self.segment_file = None
+            self.index_file = None
+
+class IndexView:
+    """Последовательность времен записей поверх отображенного в память индекса"""
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer) // INDEX_ENTRY.size
+
+    def __getitem__(self, position):
+        return INDEX_ENTRY.unpack_from(self.buffer, position * INDEX_ENTRY.size)[0]
+
+    def offset(self, position):
+        return INDEX_ENTRY.unpack_from(self.buffer, position * INDEX_ENTRY.size)[1]
+
+class SessionPlayer:
+    """Воспроизведение записи сессии через отображение сегментов в память"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".seg"):
+                continue
+            base = os.path.join(directory, name[:-4])
+            segment = self.map_file(base + ".seg")
+            index_buffer = self.map_file(base + ".idx")
+            if segment is None or index_buffer is None or segment[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                continue
+            self.segments.append((segment, IndexView(index_buffer)))
+        self.start_times = [index[0] for segment, index in self.segments]
+
+    def map_file(self, path):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def seek(self, timestamp):
+        """Позиция (сегмент, запись) первой записи не раньше timestamp за O(log n)"""
+        segment_position = max(bisect.bisect_right(self.start_times, timestamp) - 1, 0)
+        for position in range(segment_position, len(self.segments)):
+            index = self.segments[position][1]
+            record_position = bisect.bisect_left(index, timestamp)
+            if record_position < len(index):
+                return position, record_position
+        return len(self.segments), 0
+
+    def records(self, start_time=None):
+        """Записи (время, тип, данные) начиная с start_time; данные - memoryview без копирования"""
+        segment_position, record_position = self.seek(start_time) if start_time else (0, 0)
+        for segment, index in self.segments[segment_position:]:
+            for position in range(record_position, len(index)):
+                offset = index.offset(position)
+                if offset + RECORD_HEADER.size > len(segment):
+                    break  # Запись не успела дописаться
+                timestamp, kind, length = RECORD_HEADER.unpack_from(segment, offset)
+                data_start = offset + RECORD_HEADER.size
+                if data_start + length > len(segment):
+                    break
+                yield timestamp, kind, memoryview(segment)[data_start:data_start + length]
+            record_position = 0
+
+    def close(self):
+        """Закрытие отображений; все полученные memoryview должны быть освобождены"""
+        for segment, index in self.segments:
+            segment.close()
+            index.buffer.close()
+
+def main():
+    """Просмотр записи: python session_recorder.py <каталог записи> [время начала]"""
+    if len(sys.argv) < 2:
+        print("Usage: python session_recorder.py <recording_dir> [start_unix_time]")
+        sys.exit(1)
+
+    player = SessionPlayer(sys.argv[1])
+    start_time = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    counts = {}
+    first = last = None
+    for timestamp, kind, data in player.records(start_time):
+        counts[kind] = counts.get(kind, 0) + 1
+        first = timestamp if first is None else first
+        last = timestamp
+        if kind == RECORD_COMMAND:
+            print(f"{datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]} 🔧 {bytes(data).decode('utf-8')}")
+        data.release()
+
+    summary = ", ".join(f"{RECORD_KIND_NAMES.get(kind, kind)}: {count}" for kind, count in counts.items())
+    print(f"📼 Сегментов: {len(player.segments)}, записей: {summary or 0}")
+    if first is not None:
+        print(f"⏱️ Длительность: {last - first:.1f} с")
+    player.close()
+
+if __name__ == "__main__":
+    main()
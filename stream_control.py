@@ -0,0 +1,201 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# Адаптация потока экрана к каналу: качество сжатия, разрешение и FPS.
+# STREAM_ADAPTIVE=0 отключает адаптацию, STREAM_TARGET_LATENCY - допустимая задержка
+# отправки кадра в секундах, STREAM_TARGET_KBPS - потолок трафика (0 - без потолка).
+# FRAME_WINDOW - сколько кадров может быть отправлено без подтверждения показа (0 - без ограничения),
+# FRAME_ACK_TIMEOUT - через сколько секунд без подтверждений окно открывается само.
+
+DEFAULT_TARGET_LATENCY = 0.25
+# Как часто пересматривать ступень и сколько ждать перед повышением после изменения
+ADJUST_INTERVAL = 1.0
+RAISE_AFTER = 3.0
+# Окно подсчета трафика, секунды
+RATE_WINDOW = 2.0
+# Сглаживание времени отправки
+SEND_DELAY_WEIGHT = 0.3
+DEFAULT_FRAME_WINDOW = 3
+DEFAULT_ACK_TIMEOUT = 1.0
+
+# Ступени от лучшей к худшей относительно настроек клиента: поправка к качеству сжатия
+# (FRAME_QUALITY), доля разрешения, доля FPS (CAPTURE_MAX_FPS). Лучшая ступень - сами настройки.
+# Сначала снижается качество (дешевле всего для глаза), потом разрешение, потом частота
+STREAM_LADDER = (
+    (0, 1.0, 1.0),
+    (-10, 1.0, 1.0),
+    (-20, 1.0, 1.0),
+    (-30, 1.0, 0.8),
+    (-30, 0.75, 0.8),
+    (-40, 0.75, 0.6),
+    (-45, 0.5, 0.5),
+    (-55, 0.5, 0.3),
+)
+# Нижние границы качества и FPS на худших ступенях
+MIN_QUALITY = 10
+MIN_FPS = 1.0
+
+def adaptive_enabled():
+    return os.environ.get('STREAM_ADAPTIVE', '1') == '1'
+
+class BitrateController:
+    """Выбор ступени качества потока по задержке отправки и трафику
+
+    Задержка кадра - время await send() (ожидание освобождения буфера сокета)
+    плюс время, за которое при текущей скорости уйдет то, что уже лежит в буфере.
+    Превышение цели снижает ступень сразу (вдвое быстрее при сильном превышении),
+    повышение - на одну ступень и только после RAISE_AFTER секунд без проблем.
+    """
+    def __init__(self, target_latency=None, target_kbps=None):
+        self.target_latency = target_latency or float(
+            os.environ.get('STREAM_TARGET_LATENCY', DEFAULT_TARGET_LATENCY)
+        )
+        self.target_kbps = target_kbps if target_kbps is not None else float(
+            os.environ.get('STREAM_TARGET_KBPS', 0)
+        )
+        self.level = 0
+        # (время отправки, байт) за последние RATE_WINDOW секунд
+        self.samples = deque()
+        self.send_delay = 0.0
+        self.queue_delay = 0.0
+        now = time.monotonic()
+        self.last_adjust = now
+        self.last_change = now
+
+    def frame_sent(self, size, send_seconds, buffered):
+        """Учет отправленного кадра: размер, время send() и байты, оставшиеся в буфере сокета"""
+        now = time.monotonic()
+        self.samples.append((now, size))
+        while self.samples[0][0] < now - RATE_WINDOW:
+            self.samples.popleft()
+        self.send_delay += SEND_DELAY_WEIGHT * (send_seconds - self.send_delay)
+        rate = self.rate()
+        self.queue_delay = buffered / rate if rate else 0.0
+
+    def rate(self):
+        """Исходящий трафик, байт в секунду"""
+        return sum(size for _, size in self.samples) / RATE_WINDOW
+
+    def kbps(self):
+        return self.rate() * 8 / 1000
+
+    def latency(self):
+        return self.send_delay + self.queue_delay
+
+    def adjust(self):
+        """Пересмотр ступени не чаще ADJUST_INTERVAL; True, если ступень изменилась"""
+        now = time.monotonic()
+        if now - self.last_adjust < ADJUST_INTERVAL:
+            return False
+        self.last_adjust = now
+        latency = self.latency()
+        kbps = self.kbps()
+        over_budget = self.target_kbps > 0 and kbps > self.target_kbps
+        if latency > self.target_latency or over_budget:
+            step = 2 if latency > 2 * self.target_latency else 1
+            level = min(self.level + step, len(STREAM_LADDER) - 1)
+        elif (latency < self.target_latency / 2
+              and (self.target_kbps <= 0 or kbps < 0.7 * self.target_kbps)
+              and now - self.last_change >= RAISE_AFTER):
+            level = max(self.level - 1, 0)
+        else:
+            return False
+        if level == self.level:
+            return False
+        self.level = level
+        self.last_change = now
+        return True
+
+    def settings(self, base_quality, base_fps):
+        """Текущая ступень для настроек base_quality и base_fps: качество, доля разрешения и FPS
+
+        base_quality None - у кодировщика нет качества (PNG), оно и остается None.
+        """
+        quality_offset, scale, fps_share = STREAM_LADDER[self.level]
+        quality = None if base_quality is None else max(min(MIN_QUALITY, base_quality), base_quality + quality_offset)
+        fps = max(min(MIN_FPS, base_fps), base_fps * fps_share)
+        return {"level": self.level, "quality": quality, "scale": scale, "fps": fps}
+
+class FrameWindow:
+    """Окно неподтвержденных кадров между захватом и экраном управляющего
+
+    Управляющий подтверждает номер последнего показанного кадра (frame_ack),
+    подтверждение накопительное. Пока без подтверждения уже size кадров,
+    новый кадр не захватывается: лучше пропустить кадр, чем копить его
+    в буферах TCP и прокси.
+
+    Окно ограничивает отправку, только пока подтверждения приходят: до первого
+    подтверждения, после ухода управляющего (deactivate) и после ack_timeout
+    секунд без подтверждений кадры идут без ограничения. Наблюдатели кадры
+    не подтверждают, и сессия только с ними не ждет таймаута каждые size кадров.
+    """
+    def __init__(self, size=None, ack_timeout=None):
+        self.size = size if size is not None else int(os.environ.get('FRAME_WINDOW', DEFAULT_FRAME_WINDOW))
+        self.ack_timeout = ack_timeout or float(os.environ.get('FRAME_ACK_TIMEOUT', DEFAULT_ACK_TIMEOUT))
+        self.sent_id = 0
+        self.acked_id = 0
+        # Неподтвержденные кадры: номер -> время отправки (номера идут с пропусками,
+        # неизменившиеся кадры не отправляются)
+        self.sent_at = {}
+        self.ack_latency = None
+        self.last_progress = time.monotonic()
+        self.acked = asyncio.Event()
+        # Подтверждения приходят: окно ограничивает отправку
+        self.active = False
+
+    def in_flight(self):
+        return len(self.sent_at)
+
+    def is_open(self):
+        return not self.active or self.size <= 0 or self.in_flight() < self.size
+
+    def frame_sent(self, frame_id):
+        now = time.monotonic()
+        if not self.sent_at:
+            # Пустое окно: таймаут отсчитывается от первого неподтвержденного кадра
+            self.last_progress = now
+        self.sent_id = frame_id
+        self.sent_at[frame_id] = now
+
+    def ack(self, frame_id):
+        """Подтверждение показа кадра frame_id и всех предыдущих"""
+        if frame_id <= self.acked_id or frame_id > self.sent_id:
+            return
+        now = time.monotonic()
+        sent_at = self.sent_at.get(frame_id)
+        if sent_at is not None:
+            latency = now - sent_at
+            self.ack_latency = latency if self.ack_latency is None else (
+                self.ack_latency + SEND_DELAY_WEIGHT * (latency - self.ack_latency)
+            )
+        for acked in [fid for fid in self.sent_at if fid <= frame_id]:
+            del self.sent_at[acked]
+        self.acked_id = frame_id
+        self.last_progress = now
+        self.active = True
+        self.acked.set()
+
+    def deactivate(self):
+        """Подтверждений больше не будет: отправленные кадры считаются показанными, окно снимается"""
+        self.active = False
+        self.acked_id = self.sent_id
+        self.sent_at.clear()
+        self.last_progress = time.monotonic()
+        self.acked.set()
+
+    async def wait_open(self):
+        """Ожидание места в окне; False, если окно открыто по таймауту подтверждений"""
+        while not self.is_open():
+            remaining = self.last_progress + self.ack_timeout - time.monotonic()
+            if remaining <= 0:
+                # До следующего подтверждения окно не ограничивает отправку
+                self.deactivate()
+                return False
+            self.acked.clear()
+            try:
+                await asyncio.wait_for(self.acked.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
@@ -0,0 +1,94 @@
+import os
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import CTRL_OPCODES, Opcode
+
+# Режимы сжатия транспорта (переменная окружения WS_COMPRESSION)
+COMPRESSION_MODES = ("selective", "deflate", "off")
+DEFAULT_COMPRESSION_MODE = "selective"
+
+# Сообщения короче этого размера не сжимаются: заголовок deflate съедает выигрыш
+MIN_COMPRESSED_SIZE = int(os.environ.get('WS_COMPRESSION_MIN_SIZE', 64))
+
+# Параметры по умолчанию такие же, как у websockets
+SERVER_DEFLATE_OPTIONS = {
+    "server_max_window_bits": 12,
+    "client_max_window_bits": 12,
+    "compress_settings": {"memLevel": 5},
+}
+CLIENT_DEFLATE_OPTIONS = {
+    "compress_settings": {"memLevel": 5},
+}
+
+def should_compress(frame):
+    """Политика сжатия: кадры экрана (двоичные сообщения с JPEG) идут без deflate"""
+    if frame.opcode is Opcode.BINARY:
+        return False
+    return len(frame.data) >= MIN_COMPRESSED_SIZE
+
+class SelectivePerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate, который решает о сжатии для каждого сообщения отдельно
+
+    Несжатое сообщение отправляется с RSV1=0, что допускается RFC 7692,
+    поэтому собеседнику достаточно обычного permessage-deflate.
+    """
+    def __init__(self, *args, policy=should_compress, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.policy = policy
+        self.skip_message = False
+
+    @classmethod
+    def from_extension(cls, extension):
+        return cls(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+
+    def encode(self, frame):
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        if frame.opcode is not Opcode.CONT:
+            self.skip_message = not self.policy(frame)
+        if self.skip_message:
+            return frame
+        return super().encode(frame)
+
+class SelectiveServerDeflateFactory(ServerPerMessageDeflateFactory):
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(params, accepted_extensions)
+        return response_params, SelectivePerMessageDeflate.from_extension(extension)
+
+class SelectiveClientDeflateFactory(ClientPerMessageDeflateFactory):
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        return SelectivePerMessageDeflate.from_extension(extension)
+
+def compression_mode(mode=None):
+    mode = (mode or os.environ.get('WS_COMPRESSION', DEFAULT_COMPRESSION_MODE)).lower()
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"Неизвестный режим сжатия: {mode}")
+    return mode
+
+def server_compression_options(mode=None):
+    """Аргументы websockets.serve для выбранного режима сжатия"""
+    mode = compression_mode(mode)
+    if mode == "off":
+        return {"compression": None}
+    if mode == "deflate":
+        return {"compression": "deflate"}
+    return {"compression": None, "extensions": [SelectiveServerDeflateFactory(**SERVER_DEFLATE_OPTIONS)]}
+
+def client_compression_options(mode=None):
+    """Аргументы websockets.connect для выбранного режима сжатия"""
+    mode = compression_mode(mode)
+    if mode == "off":
+        return {"compression": None}
+    if mode == "deflate":
+        return {"compression": "deflate"}
+    return {"compression": None, "extensions": [SelectiveClientDeflateFactory(**CLIENT_DEFLATE_OPTIONS)]}